@@ -0,0 +1,199 @@
+import asyncio
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import httpx
+import pandas as pd
+
+from analysis.benchmarks.lib import Benchmark, MockDatabasin, MockNABat
+from analysis.databasin.lib import fetch_datasets, merge_datasets
+from analysis.nabat.lib import (
+    NABatClient,
+    get_all_species,
+    get_user_projects,
+    get_project_info,
+    sync_stationary_acoustic_counts,
+    combine_stationary_acoustic_counts,
+)
+from analysis.nabat.lib.bulk import fetch_project_counts, merge_project_counts
+
+
+### Benchmark settings
+# NOTE: these do not require credentials or network access; all requests are
+# handled by local mock services that generate synthetic data
+
+NUM_PROJECTS = 20
+RECORDS_PER_PROJECT = 20_000
+NABAT_LATENCY = 0.1  # seconds per request
+# NOTE: failed requests are retried after a delay of several seconds
+NABAT_ERROR_RATE = 0
+NABAT_MAX_CONCURRENCY = 4
+
+NUM_DATASETS = 8
+RECORDS_PER_DATASET = 100_000
+DATABASIN_LATENCY = 0.1  # seconds per request
+DATABASIN_MAX_WORKERS = 4
+
+# set to True to also trace peak memory allocated by Python and numpy in each
+# stage; this substantially slows down stages that allocate many Python objects
+# NOTE: peak resident memory of each stage is reported on Linux regardless;
+# memory is always traced where that is not available
+TRACE_MEMORY = False
+
+
+out_dir = Path("data/benchmarks")
+out_dir.mkdir(exist_ok=True, parents=True)
+
+
+async def benchmark_nabat(tmp_dir):
+    mock = MockNABat(
+        num_projects=NUM_PROJECTS,
+        records_per_project=RECORDS_PER_PROJECT,
+        latency=NABAT_LATENCY,
+        error_rate=NABAT_ERROR_RATE,
+    )
+    print("Generating synthetic NABat data")
+    mock.prepare()
+
+    benchmark = Benchmark("nabat", trace_memory=TRACE_MEMORY)
+
+    async with (
+        httpx.AsyncClient(transport=mock.transport) as http_client,
+        NABatClient("refresh-token", http_client=http_client) as client,
+    ):
+        with benchmark.stage("access token"):
+            await client.token.get()
+
+        with benchmark.stage("species") as stage:
+            df = await get_all_species(client)
+            stage["records"] = len(df)
+
+        with benchmark.stage("user projects") as stage:
+            df = await get_user_projects(client, client.user_id)
+            project_ids = df.id.values.tolist()
+            stage["records"] = len(df)
+
+        with benchmark.stage("project info") as stage:
+            project_df = await get_project_info(client, project_ids)
+            stage["records"] = len(project_df)
+
+        mock.reset_stats()
+        with benchmark.stage("fetch counts") as stage:
+            merged = await fetch_project_counts(client, project_ids, max_concurrency=NABAT_MAX_CONCURRENCY)
+            stage["records"] = sum(len(df) for df in merged)
+            stage["bytes"] = mock.total_bytes_sent
+
+        with benchmark.stage("merge counts") as stage:
+            df = merge_project_counts(merged)
+            stage["records"] = len(df)
+
+        del merged, df
+
+        mock.reset_stats()
+        with benchmark.stage("sync counts (full)") as stage:
+            await sync_stationary_acoustic_counts(
+                client, project_df, tmp_dir, full=True, max_concurrency=NABAT_MAX_CONCURRENCY
+            )
+            stage["records"] = NUM_PROJECTS * RECORDS_PER_PROJECT
+            stage["bytes"] = mock.total_bytes_sent
+
+        with benchmark.stage("sync counts (unchanged)"):
+            await sync_stationary_acoustic_counts(client, project_df, tmp_dir, max_concurrency=NABAT_MAX_CONCURRENCY)
+
+        with benchmark.stage("combine counts") as stage:
+            stage["records"] = len(combine_stationary_acoustic_counts(tmp_dir))
+
+    (out_dir / "nabat_request_stats.json").write_text(json.dumps(client.stats.summary(), indent=2))
+
+    return benchmark
+
+
+def benchmark_databasin(tmp_dir):
+    mock = MockDatabasin(num_datasets=NUM_DATASETS, records_per_dataset=RECORDS_PER_DATASET, latency=DATABASIN_LATENCY)
+    print("Generating synthetic Data Basin data")
+    mock.prepare()
+
+    client = mock.create_client()
+    benchmark = Benchmark("databasin", trace_memory=TRACE_MEMORY)
+
+    cache_dir = tmp_dir / "datasets"
+    cache_dir.mkdir()
+
+    with benchmark.stage("fetch datasets") as stage:
+        merged = fetch_datasets(client, mock.dataset_ids, max_workers=DATABASIN_MAX_WORKERS, cache_dir=cache_dir)
+        stage["records"] = sum(len(df) for df in merged)
+        stage["bytes"] = mock.bytes_sent
+
+    with benchmark.stage("merge datasets") as stage:
+        df = merge_datasets(client, merged, metadata_filename=tmp_dir / "dataset_metadata.feather")
+        stage["records"] = len(df)
+
+    del merged, df
+
+    # only the most recent dataset is typically modified between downloads
+    mock.modify(mock.dataset_ids[-1])
+    mock.reset_stats()
+    with benchmark.stage("fetch datasets (cached)") as stage:
+        merged = fetch_datasets(client, mock.dataset_ids, max_workers=DATABASIN_MAX_WORKERS, cache_dir=cache_dir)
+        stage["records"] = sum(len(df) for df in merged)
+        stage["bytes"] = mock.bytes_sent
+
+    with benchmark.stage("merge datasets (cached metadata)") as stage:
+        stage["records"] = len(merge_datasets(client, merged, metadata_filename=tmp_dir / "dataset_metadata.feather"))
+
+    return benchmark
+
+
+with TemporaryDirectory() as tmp_dir:
+    tmp_dir = Path(tmp_dir)
+    (tmp_dir / "nabat").mkdir()
+    (tmp_dir / "databasin").mkdir()
+
+    nabat = asyncio.run(benchmark_nabat(tmp_dir / "nabat"))
+    databasin = benchmark_databasin(tmp_dir / "databasin")
+
+
+results = pd.concat([nabat.to_frame(), databasin.to_frame()], ignore_index=True)
+
+table = results.assign(
+    elapsed=results.elapsed.round(2),
+    peak_rss_mb=(results.get("peak_rss", pd.Series(dtype="float64")) / 1e6).round(1),
+    peak_memory_mb=(results.get("peak_memory", pd.Series(dtype="float64")) / 1e6).round(1),
+    process_max_rss_mb=(results.get("process_max_rss", pd.Series(dtype="float64")) / 1e6).round(1),
+)[
+    [
+        "benchmark",
+        "stage",
+        "elapsed",
+        "records",
+        "records_per_sec",
+        "mb_per_sec",
+        "peak_rss_mb",
+        "peak_memory_mb",
+        "process_max_rss_mb",
+    ]
+].astype("object")
+
+print("\n------------------------------------------------------")
+print(table.where(table.notnull(), "").to_string(index=False))
+
+(out_dir / "download.json").write_text(
+    json.dumps(
+        {
+            "settings": {
+                "num_projects": NUM_PROJECTS,
+                "records_per_project": RECORDS_PER_PROJECT,
+                "nabat_latency": NABAT_LATENCY,
+                "nabat_error_rate": NABAT_ERROR_RATE,
+                "nabat_max_concurrency": NABAT_MAX_CONCURRENCY,
+                "num_datasets": NUM_DATASETS,
+                "records_per_dataset": RECORDS_PER_DATASET,
+                "databasin_latency": DATABASIN_LATENCY,
+                "databasin_max_workers": DATABASIN_MAX_WORKERS,
+            },
+            "stages": json.loads(results.to_json(orient="records")),
+        },
+        indent=2,
+    )
+)
@@ -0,0 +1,5 @@
+from analysis.benchmarks.lib.databasin import MockDatabasin, MockDatabasinClient
+from analysis.benchmarks.lib.nabat import MockNABat
+from analysis.benchmarks.lib.stats import Benchmark
+
+__all__ = [MockDatabasin, MockDatabasinClient, MockNABat, Benchmark]
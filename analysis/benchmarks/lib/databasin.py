@@ -0,0 +1,252 @@
+import io
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import urljoin
+
+from databasin.exceptions import ForbiddenError
+import numpy as np
+import pandas as pd
+
+from analysis.constants import ACTIVITY_COLUMNS
+from analysis.databasin.lib.datasets import EXTRA_ACTIVITY_COLUMNS, STRING_COLUMNS
+
+
+# columns present in uploaded datasets that are not read by the downloader
+IGNORED_COLUMNS = ["notes", "rec_id", "qa_flag"]
+
+
+class MockDatabasin(object):
+    def __init__(self, num_datasets=5, records_per_dataset=50_000, latency=0.05, blocked_rate=0.1, seed=0):
+        """Local stand-in for Data Basin that generates synthetic dataset
+        metadata and CSV data for the methods used in analysis/databasin/lib.
+
+        Use create_client() to create a client that can be used in place of
+        databasin.client.Client.
+
+        Responses are deterministic for a given seed and dataset ID.
+
+        Parameters
+        ----------
+        num_datasets : int, optional (default: 5)
+            number of aggregate datasets available for download
+        records_per_dataset : int, optional (default: 50000)
+            number of records in the CSV data of each aggregate dataset
+        latency : float, optional (default: 0.05)
+            number of seconds to wait before responding to each request
+        blocked_rate : float, optional (default: 0.1)
+            proportion of source datasets that are not accessible to the user
+        seed : int, optional (default: 0)
+            random seed
+        """
+        self.num_datasets = num_datasets
+        self.records_per_dataset = records_per_dataset
+        self.latency = latency
+        self.blocked_rate = blocked_rate
+        self.seed = seed
+
+        self.dataset_ids = [f"{i:032x}" for i in range(1, num_datasets + 1)]
+        self.modify_dates = {id: "2024-01-01T00:00:00Z" for id in self.dataset_ids}
+
+        self._csv = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def create_client(self):
+        """Create client bound to this service.
+
+        Returns
+        -------
+        MockDatabasinClient
+        """
+        # clients are cloned by type for each thread, so bind service to type
+        return type("Client", (MockDatabasinClient,), {"service": self})()
+
+    def reset_stats(self):
+        """Reset counts of requests and bytes sent"""
+        self.requests = {"dataset": 0, "data": 0}
+        self.bytes_sent = 0
+
+    def modify(self, id):
+        """Mark dataset as modified so that it is downloaded again
+
+        Parameters
+        ----------
+        id : str
+            dataset ID
+        """
+        self.modify_dates[id] = pd.Timestamp.now(tz="UTC").isoformat()
+
+    def prepare(self):
+        """Generate CSV data for all datasets in advance so that generating them
+        is not included in the time to download them.
+        """
+        for id in self.dataset_ids:
+            self.get_csv(id)
+
+    def get_source_dataset_ids(self, id):
+        """Get IDs of source datasets combined into aggregate dataset
+
+        Parameters
+        ----------
+        id : str
+            aggregate dataset ID
+
+        Returns
+        -------
+        list of str
+        """
+        return [f"{int(id, 16):08x}{i:024x}" for i in range(max(self.records_per_dataset // 5_000, 1))]
+
+    def get_dataset(self, id):
+        """Get metadata for aggregate or source dataset.
+
+        Parameters
+        ----------
+        id : str
+
+        Returns
+        -------
+        SimpleNamespace
+        """
+        with self._lock:
+            self.requests["dataset"] += 1
+
+        time.sleep(self.latency)
+
+        if id in self.modify_dates:
+            return SimpleNamespace(
+                id=id,
+                title=f"Aggregate dataset {id}",
+                user_can_download=True,
+                modify_date=self.modify_dates[id],
+                version=1,
+                file_size=len(self.get_csv(id)),
+            )
+
+        # source datasets
+        if np.random.default_rng([self.seed, int(id, 16) % (1 << 32)]).random() < self.blocked_rate:
+            raise ForbiddenError("You do not have permission to view this dataset")
+
+        return SimpleNamespace(
+            id=id, title=f"Source dataset {id}", user_can_download=False, modify_date=None, version=1, file_size=None
+        )
+
+    def get_data(self, id):
+        """Get CSV data for aggregate dataset as a streaming response
+
+        Parameters
+        ----------
+        id : str
+
+        Returns
+        -------
+        SimpleNamespace
+        """
+        content = self.get_csv(id)
+        with self._lock:
+            self.requests["data"] += 1
+            self.bytes_sent += len(content)
+
+        time.sleep(self.latency)
+
+        return SimpleNamespace(
+            status_code=200, encoding="utf-8", raw=io.BytesIO(content), raise_for_status=lambda: None
+        )
+
+    def get_csv(self, id):
+        """Get encoded CSV data for aggregate dataset; these are cached because
+        they are expensive to generate.
+
+        Parameters
+        ----------
+        id : str
+
+        Returns
+        -------
+        bytes
+        """
+        with self._lock:
+            if id not in self._csv:
+                self._csv[id] = self.generate_csv(id)
+
+            return self._csv[id]
+
+    def generate_csv(self, id):
+        """Generate synthetic CSV data for an aggregate dataset.
+
+        Each site has a detector deployed for a few nights at a given height;
+        activity values are reported for a random subset of species.
+
+        Parameters
+        ----------
+        id : str
+
+        Returns
+        -------
+        bytes
+        """
+        n = self.records_per_dataset
+        rng = np.random.default_rng([self.seed, int(id, 16) % (1 << 32)])
+
+        num_sites = max(n // 10, 1)
+        site_ix = rng.integers(0, num_sites, size=n)
+        source_ids = np.array(self.get_source_dataset_ids(id))
+
+        df = pd.DataFrame(
+            {
+                "source_dataset": source_ids[site_ix % len(source_ids)],
+                "site_id": pd.Series(site_ix).map("_Site {}".format),
+                "db_longitude": (-120 + site_ix % 500 * 0.1).round(5),
+                "db_latitude": (30 + site_ix // 500 * 0.1).round(5),
+                "mic_ht": rng.choice([1.5, 3, 10], size=n),
+                "mic_ht_units": rng.choice(["meters", "feet"], size=n),
+                "night": (np.datetime64("2020-05-01") + rng.integers(0, 1500, size=n).astype("timedelta64[D]")).astype(
+                    "str"
+                ),
+            }
+        )
+
+        for col in STRING_COLUMNS:
+            if col not in df.columns:
+                df[col] = rng.choice(["", " None", "value ", "other"], size=n)
+
+        for col in ACTIVITY_COLUMNS + EXTRA_ACTIVITY_COLUMNS:
+            values = pd.Series(rng.poisson(2, size=n), dtype="float64")
+            df[col] = values.where(rng.random(n) < 0.2)
+
+        for col in IGNORED_COLUMNS:
+            df[col] = rng.choice(["a", "b", "c"], size=n)
+
+        # column order of uploaded datasets varies
+        df = df[df.columns.values.take(rng.permutation(len(df.columns)))]
+
+        return df.to_csv(index=False, float_format="%g").encode("utf-8")
+
+
+class MockDatabasinClient(object):
+    service = None
+
+    def __init__(self):
+        """Client for MockDatabasin with the same interface as the parts of
+        databasin.client.Client used in analysis/databasin/lib.
+
+        Create using MockDatabasin.create_client()
+        """
+        self.base_url = "https://databasin.mock/"
+        self.username = None
+        self.api_key = None
+
+    def set_api_key(self, username, api_key):
+        self.username = username
+        self.api_key = api_key
+
+    def build_url(self, path):
+        return urljoin(self.base_url, path)
+
+    def get_dataset(self, id):
+        return self.service.get_dataset(id)
+
+    def get(self, url, stream=False):
+        # /api/v1/datasets/<id>/data/
+        return self.service.get_data(url.rstrip("/").split("/")[-2])
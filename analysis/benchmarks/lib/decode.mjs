@@ -0,0 +1,43 @@
+// Time decoding a Feather (Arrow IPC) file with arquero, the same way it is
+// loaded by the UI.
+//
+// This is run using --eval from the ui directory so that arquero is resolved
+// from ui/node_modules:
+// node --input-type=module -e "<this script>" <filename> <iterations>
+//
+// Writes {"decode_ms": <mean>, "min_decode_ms": <min>} or {"error": <message>}
+// to stdout as JSON.
+
+import { readFileSync } from 'node:fs'
+
+const [filename, iterations] = process.argv.slice(1)
+
+try {
+  const { fromArrow } = await import('arquero')
+  const bytes = new Uint8Array(readFileSync(filename))
+
+  const decode = () => {
+    const table = fromArrow(bytes)
+    // materialize all columns instead of only reading the schema
+    table.columnNames().forEach((name) => table.array(name))
+  }
+
+  // warm up JIT before timing
+  decode()
+
+  const times = []
+  for (let i = 0; i < parseInt(iterations, 10); i += 1) {
+    const start = performance.now()
+    decode()
+    times.push(performance.now() - start)
+  }
+
+  console.log(
+    JSON.stringify({
+      decode_ms: times.reduce((a, b) => a + b, 0) / times.length,
+      min_decode_ms: Math.min(...times),
+    })
+  )
+} catch (ex) {
+  console.log(JSON.stringify({ error: ex.message }))
+}
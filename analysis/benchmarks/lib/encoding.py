@@ -0,0 +1,74 @@
+import gzip
+import json
+from pathlib import Path
+import shutil
+import subprocess
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+DECODE_SCRIPT = Path(__file__).parent / "decode.mjs"
+
+
+def get_transfer_sizes(filename):
+    """Get size of a file when compressed for transfer by a web server
+
+    Files are compressed at the highest level, as is typical for precompressed
+    static files.
+
+    Parameters
+    ----------
+    filename : Path
+
+    Returns
+    -------
+    dict
+        {"gzip_bytes": <int>, "brotli_bytes": <int or None if brotli is not installed>}
+    """
+    data = filename.read_bytes()
+    return {
+        "gzip_bytes": len(gzip.compress(data, compresslevel=9, mtime=0)),
+        "brotli_bytes": len(brotli.compress(data)) if brotli is not None else None,
+    }
+
+
+def time_decode(filename, ui_dir, iterations=20):
+    """Time decoding a Feather file in Node using the version of arquero
+    installed for the UI
+
+    Parameters
+    ----------
+    filename : Path
+    ui_dir : Path
+        UI root directory; dependencies must be installed
+    iterations : int, optional (default: 20)
+
+    Returns
+    -------
+    dict
+        {"decode_ms": <mean>, "min_decode_ms": <min>} or {"error": <message>}
+        if the file could not be decoded
+    """
+    if shutil.which("node") is None:
+        return {"error": "node is not installed"}
+
+    ret = subprocess.run(
+        [
+            "node",
+            "--input-type=module",
+            "-e",
+            DECODE_SCRIPT.read_text(),
+            str(Path(filename).resolve()),
+            str(iterations),
+        ],
+        cwd=ui_dir,
+        capture_output=True,
+    )
+
+    if ret.returncode != 0:
+        return {"error": ret.stderr.decode("utf8", errors="replace").strip().splitlines()[-1]}
+
+    return json.loads(ret.stdout)
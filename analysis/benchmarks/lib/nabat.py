@@ -0,0 +1,373 @@
+import asyncio
+import json
+
+import httpx
+import numpy as np
+import shapely
+
+from analysis.constants import SPECIES
+
+
+# headers of visualizationData response, in the order returned by NABat
+VISUALIZATION_HEADERS = [
+    "project_id",
+    "project_name",
+    "organization_id",
+    "organization_name",
+    "grts_cell_id",
+    "grts_id",
+    "sample_frame",
+    "location_name",
+    "event_id",
+    "event_geometry_id",
+    "batch_id",
+    "night",
+    "start_time",
+    "end_time",
+    "year",
+    "month",
+    "day",
+    "species_id",
+    "species_code",
+    "species_list",
+    "count_auto_id",
+    "count_vetted",
+    "reviewed",
+    "confirmed",
+    "software_id",
+    "software",
+    "detector",
+    "microphone",
+    "microphone_orientation",
+    "microphone_height_meters",
+    "distance_to_clutter_meters",
+    "clutter",
+    "clutter_percent",
+    "habitat_type",
+    "distance_to_water",
+    "sample_design",
+    "grts_geometry",
+    "geometry",
+]
+
+SPECIES_CODES = sorted(code.upper() for code in SPECIES.keys())
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+# size of chunks used to stream response bodies
+CHUNK_SIZE = 1 << 16  # 64 KB
+
+
+def format_date(date):
+    """Format date the same way NABat does (JavaScript Date.toString)
+
+    Parameters
+    ----------
+    date : numpy.datetime64
+
+    Returns
+    -------
+    str
+    """
+    date = date.astype("datetime64[D]").item()
+    return f"{WEEKDAYS[date.weekday()]} {MONTHS[date.month - 1]} {date.day:02d} {date.year} 00:00:00 GMT+0000 (Coordinated Universal Time)"
+
+
+class MockNABat(object):
+    def __init__(
+        self,
+        num_projects=10,
+        records_per_project=10_000,
+        latency=0.05,
+        error_rate=0,
+        token_expires_in=300,
+        seed=0,
+    ):
+        """Local stand-in for the NABat GraphQL API that generates synthetic
+        responses for the queries used in analysis/nabat/lib.
+
+        Use as the transport of an httpx.AsyncClient:
+        httpx.AsyncClient(transport=MockNABat(...).transport)
+
+        Responses are deterministic for a given seed and project ID.
+
+        Parameters
+        ----------
+        num_projects : int, optional (default: 10)
+            number of projects available to user
+        records_per_project : int, optional (default: 10000)
+            number of nightly count records returned for each project
+        latency : float, optional (default: 0.05)
+            number of seconds to wait before responding to each request
+        error_rate : float, optional (default: 0)
+            proportion of visualizationData requests that fail with status 503
+        token_expires_in : int, optional (default: 300)
+            number of seconds before access tokens expire
+        seed : int, optional (default: 0)
+            random seed
+        """
+        self.num_projects = num_projects
+        self.records_per_project = records_per_project
+        self.latency = latency
+        self.error_rate = error_rate
+        self.token_expires_in = token_expires_in
+        self.seed = seed
+        self.project_ids = list(range(1001, 1001 + num_projects))
+
+        self._rng = np.random.default_rng(seed)
+        self._payloads = {}
+        self.reset_stats()
+
+    @property
+    def transport(self):
+        return httpx.MockTransport(self.handler)
+
+    def reset_stats(self):
+        """Reset counts of requests and bytes sent by operation"""
+        self.requests = {}
+        self.bytes_sent = {}
+        self.errors = 0
+
+    @property
+    def total_bytes_sent(self):
+        return sum(self.bytes_sent.values())
+
+    def prepare(self):
+        """Generate visualizationData responses for all projects in advance so
+        that generating them is not included in the time to download them.
+        """
+        for id in self.project_ids:
+            self.get_visualization_payload([id])
+
+    def get_visualization_payload(self, project_ids):
+        """Get encoded visualizationData response for projects; these are
+        cached because they are expensive to generate.
+
+        Parameters
+        ----------
+        project_ids : list of int
+
+        Returns
+        -------
+        bytes
+        """
+        key = tuple(project_ids)
+        if key not in self._payloads:
+            self._payloads[key] = json.dumps({"data": self.visualization_data(project_ids)}).encode("utf8")
+
+        return self._payloads[key]
+
+    async def handler(self, request):
+        """Handle GraphQL request sent via httpx.MockTransport
+
+        Parameters
+        ----------
+        request : httpx.Request
+
+        Returns
+        -------
+        httpx.Response
+        """
+        payload = json.loads(request.content)
+        operation = payload["operationName"]
+        variables = payload.get("variables", {})
+
+        self.requests[operation] = self.requests.get(operation, 0) + 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if operation != "authTokenRefresh" and not request.headers.get("Authorization", "").startswith("Bearer "):
+            return httpx.Response(401)
+
+        if operation == "visualizationData":
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.errors += 1
+                return httpx.Response(503)
+
+            content = self.get_visualization_payload(variables["projectIds"])
+
+        else:
+            if operation == "authTokenRefresh":
+                data = self.auth_token_refresh(variables)
+            elif operation == "allSpecies":
+                data = self.all_species()
+            elif operation == "userByEmail":
+                data = {"userByEmail": {"id": 1}}
+            elif operation == "allVwUserProjects":
+                data = self.all_user_projects()
+            elif operation == "allProjects":
+                data = self.all_projects(variables["projectIds"])
+            else:
+                return httpx.Response(400, json={"errors": [{"message": f"Unknown operation {operation}"}]})
+
+            content = json.dumps({"data": data}).encode("utf8")
+
+        self.bytes_sent[operation] = self.bytes_sent.get(operation, 0) + len(content)
+
+        async def stream():
+            for i in range(0, len(content), CHUNK_SIZE):
+                yield content[i : i + CHUNK_SIZE]
+
+        return httpx.Response(200, headers={"Content-Type": "application/json"}, content=stream())
+
+    def auth_token_refresh(self, variables):
+        count = self.requests["authTokenRefresh"]
+        return {
+            "authTokenRefresh": {
+                "user_id": 1,
+                "access_token": f"Bearer access-token-{count}",
+                "expires_in": self.token_expires_in,
+            }
+        }
+
+    def all_species(self):
+        return {
+            "allSpecies": {
+                "nodes": [
+                    {
+                        "id": i + 1,
+                        "speciesCode": code,
+                        "species": SPECIES[code.lower()]["SNAME"],
+                        "commonName": SPECIES[code.lower()]["CNAME"],
+                    }
+                    for i, code in enumerate(SPECIES_CODES)
+                ]
+            }
+        }
+
+    def all_user_projects(self):
+        # projects are listed once per role of user
+        return {
+            "allVwUserProjects": {
+                "nodes": [{"id": id, "name": f" Project {id} "} for id in self.project_ids for _ in range(1 + id % 2)]
+            }
+        }
+
+    def all_projects(self, project_ids):
+        nodes = []
+        for id in project_ids:
+            num_surveys = max(self.records_per_project // 100, 1)
+            nodes.append(
+                {
+                    "id": id,
+                    "name": f"Project {id}",
+                    "organization": {"name": f"Organization {id % 7}"},
+                    "collaborating_organizations": {"nodes": [{"organization": {"name": f"Organization {id % 5}"}}]},
+                    "leaders": {
+                        "nodes": [{"role": {"role": "Project Leader"}, "user": {"first": "First", "last": f"Last{id}"}}]
+                    },
+                    "surveys": {
+                        "count": num_surveys,
+                        "nodes": [{"survey_events": {"count": 4}} for _ in range(num_surveys)],
+                    },
+                }
+            )
+
+        return {
+            "allProjects": {"nodes": nodes},
+            "allPublicDataReferences": {"nodes": [{"projectId": id, "share_coords": 0} for id in project_ids]},
+        }
+
+    def visualization_data(self, project_ids):
+        rows = []
+        for project_id in project_ids:
+            rows.extend(self.generate_project_rows(project_id))
+
+        return {"visualizationData": {"headers": VISUALIZATION_HEADERS, "body": rows}}
+
+    def generate_project_rows(self, project_id):
+        """Generate synthetic nightly count records for a project.
+
+        Each survey event is a detector deployed at a point within a GRTS cell
+        for a few nights, with a count for each of several species per night.
+        About a third of events do not share precise coordinates.
+
+        Parameters
+        ----------
+        project_id : int
+
+        Returns
+        -------
+        list of lists
+        """
+        n = self.records_per_project
+        if n == 0:
+            return []
+
+        rng = np.random.default_rng([self.seed, project_id])
+
+        num_species = 4
+        num_events = max(n // (num_species * 3), 1)
+
+        event_ix = np.arange(n) // (num_species * 3) % num_events
+        night_ix = np.arange(n) // num_species % 3
+        species_ix = rng.integers(0, len(SPECIES_CODES), size=(num_events, num_species))[
+            event_ix, np.arange(n) % num_species
+        ]
+
+        grts_cell_ids = rng.integers(1, 100_000, size=num_events)
+        x = -120 + (grts_cell_ids % 400) * 0.1
+        y = 30 + (grts_cell_ids // 400) * 0.1
+        grts_geometry = shapely.to_wkb(shapely.box(x, y, x + 0.1, y + 0.1), hex=True)
+
+        has_point = rng.random(num_events) > 0.33
+        points = shapely.to_wkb(
+            shapely.points(x + rng.random(num_events) * 0.1, y + rng.random(num_events) * 0.1), hex=True
+        )
+        start = np.datetime64("2020-05-01") + rng.integers(0, 1500, size=num_events).astype("timedelta64[D]")
+        nights = start[event_ix] + night_ix.astype("timedelta64[D]")
+
+        counts = rng.poisson(5, size=n)
+        heights = rng.choice([1.5, 3.0, 6.0], size=num_events)
+
+        rows = []
+        for i in range(n):
+            e = event_ix[i]
+            night = format_date(nights[i])
+            date = nights[i].astype("datetime64[D]").item()
+            rows.append(
+                [
+                    project_id,
+                    f"Project {project_id}",
+                    project_id % 7,
+                    f"Organization {project_id % 7}",
+                    int(grts_cell_ids[e]),
+                    int(grts_cell_ids[e]) % 1000,
+                    "CONUS",
+                    f"Site {e}",
+                    int(project_id * 100_000 + e),
+                    int(project_id * 100_000 + e) if has_point[e] else None,
+                    int(project_id * 10 + e % 3),
+                    night,
+                    format_date(start[e]),
+                    format_date(start[e] + np.timedelta64(2, "D")),
+                    date.year,
+                    date.month,
+                    date.day,
+                    int(species_ix[i]) + 1,
+                    SPECIES_CODES[species_ix[i]],
+                    "Default",
+                    int(counts[i]),
+                    int(counts[i]) if i % 5 == 0 else None,
+                    None,
+                    None,
+                    int(e % 3) + 1,
+                    "Kaleidoscope",
+                    "SM4BAT",
+                    "SMM-U2",
+                    "Vertical",
+                    float(heights[e]),
+                    None,
+                    "Low",
+                    None,
+                    "Forest",
+                    None,
+                    "true" if e % 2 else "false",
+                    grts_geometry[e],
+                    points[e] if has_point[e] else None,
+                ]
+            )
+
+        return rows
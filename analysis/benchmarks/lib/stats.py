@@ -0,0 +1,139 @@
+from contextlib import contextmanager
+from pathlib import Path
+import re
+import resource
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+def get_max_rss():
+    """Get the high-water mark of resident memory of this process since it
+    started.
+
+    NOTE: this never decreases unless reset by reset_peak_rss(), so it is not
+    the peak memory of an individual stage if an earlier stage used more memory.
+
+    Returns
+    -------
+    int
+        bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_peak_rss():
+    """Reset the high-water mark of resident memory of this process to its
+    current resident memory, so that the peak of each stage can be measured
+    separately.
+
+    NOTE: this is only supported on Linux.
+
+    Returns
+    -------
+    bool
+        True if the high-water mark was reset
+    """
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss():
+    """Get the high-water mark of resident memory of this process since it was
+    last reset by reset_peak_rss() (Linux only)
+
+    Returns
+    -------
+    int
+        bytes
+    """
+    match = re.search(r"^VmHWM:\s+(\d+) kB", Path("/proc/self/status").read_text(), re.MULTILINE)
+    return int(match.group(1)) * 1024
+
+
+class Benchmark(object):
+    def __init__(self, name, trace_memory=False):
+        """Collect timing, throughput, and memory use for each stage of a
+        benchmark.
+
+        Peak resident memory of the process during each stage (including memory
+        allocated by Arrow and other threads) is reported where the high-water
+        mark of resident memory can be reset (Linux); elsewhere, peak memory
+        allocated by Python and numpy during each stage is always traced, and
+        the high-water mark of resident memory of the process since it started
+        is reported after each stage.
+
+        Parameters
+        ----------
+        name : str
+        trace_memory : bool, optional (default: False)
+            if True, also trace peak memory allocated by Python and numpy during
+            each stage; this slows down stages that allocate many Python
+            objects. Memory allocated by Arrow is not traced.
+        """
+        self.name = name
+        self.reset_rss = reset_peak_rss()
+        self.trace_memory = trace_memory or not self.reset_rss
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Measure a stage of the benchmark.
+
+        Set "records" and "bytes" on the yielded dict to calculate throughput.
+
+        Parameters
+        ----------
+        name : str
+
+        Yields
+        ------
+        dict
+        """
+        result = {"benchmark": self.name, "stage": name, "records": None, "bytes": None}
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+
+        if self.reset_rss:
+            reset_peak_rss()
+
+        start = time.perf_counter()
+        yield result
+        result["elapsed"] = time.perf_counter() - start
+
+        if self.trace_memory:
+            result["peak_memory"] = tracemalloc.get_traced_memory()[1] - start_memory
+
+        if self.reset_rss:
+            result["peak_rss"] = get_peak_rss()
+        else:
+            # process-wide; includes peaks of earlier stages
+            result["process_max_rss"] = get_max_rss()
+
+        self.stages.append(result)
+        print(f"{self.name}: {name} completed in {result['elapsed']:.2f}s")
+
+    def to_frame(self):
+        """Get results of all stages with throughput in records/s and MB/s
+
+        Returns
+        -------
+        DataFrame
+        """
+        df = pd.DataFrame(self.stages)
+        df["records"] = df.records.astype("Int64")
+        df["bytes"] = df.bytes.astype("Int64")
+        df["records_per_sec"] = (df.records / df.elapsed).round(0)
+        df["mb_per_sec"] = (df.bytes / 1e6 / df.elapsed).round(2)
+        return df
@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+
+from analysis.benchmarks.lib.encoding import get_transfer_sizes, time_decode
+from analysis.lib.output import PROFILES, write_table
+
+
+### Benchmark settings
+# NOTE: these are the outputs of merge.py, which must be run first. Decode
+# times are measured in Node using the UI's dependencies, which must be
+# installed in UI_DIR.
+
+OUTPUTS = {
+    "detectors": {"filename": Path("ui/static/data/detectors.feather"), "sort_by": ["id"]},
+    "spp_detections": {
+        "filename": Path("ui/static/data/spp_detections.feather"),
+        "sort_by": ["species", "detId", "year", "month"],
+    },
+    "occurrence": {
+        "filename": Path("ui/static/data/occurrence.feather"),
+        "sort_by": ["species", "year", "month", "siteId", "source", "countType"],
+    },
+}
+UI_DIR = Path("ui")
+DECODE_ITERATIONS = 20
+# used to estimate load time (transfer + decode) from gzip transfer size
+BANDWIDTH = 10e6 / 8  # bytes per second (10 Mbps)
+
+
+out_dir = Path("data/benchmarks")
+out_dir.mkdir(exist_ok=True, parents=True)
+
+
+results = []
+with TemporaryDirectory() as tmp_dir:
+    tmp_dir = Path(tmp_dir)
+
+    for name, output in OUTPUTS.items():
+        # categorical columns are read back as categories from dictionary
+        # encoded columns
+        df = pd.read_feather(output["filename"])
+
+        for profile in PROFILES:
+            print(f"Encoding {name} using {profile}")
+            filename = tmp_dir / f"{name}_{profile}.feather"
+            write_table(df, filename, profile=profile, sort_by=output["sort_by"])
+
+            result = {
+                "output": name,
+                "profile": profile,
+                "bytes": filename.stat().st_size,
+                **get_transfer_sizes(filename),
+                **time_decode(filename, UI_DIR, iterations=DECODE_ITERATIONS),
+            }
+            if "decode_ms" in result:
+                result["load_ms"] = result["gzip_bytes"] / BANDWIDTH * 1000 + result["decode_ms"]
+
+            results.append(result)
+
+
+results = pd.DataFrame(results)
+for col in ["decode_ms", "min_decode_ms", "load_ms", "error"]:
+    if col not in results.columns:
+        results[col] = None
+
+# only recommend profiles that could be decoded by the UI
+recommended = {}
+for name, group in results.loc[results.load_ms.notnull()].groupby("output"):
+    recommended[name] = group.sort_values("load_ms").profile.iloc[0]
+
+table = results.assign(
+    kb=(results.bytes / 1e3).round(1),
+    gzip_kb=(results.gzip_bytes / 1e3).round(1),
+    brotli_kb=(results.brotli_bytes.astype("float") / 1e3).round(1),
+    decode_ms=results.decode_ms.astype("float").round(1),
+    load_ms=results.load_ms.astype("float").round(1),
+)[["output", "profile", "kb", "gzip_kb", "brotli_kb", "decode_ms", "load_ms", "error"]].astype("object")
+
+print("\n------------------------------------------------------")
+print(table.where(table.notnull(), "").to_string(index=False))
+
+if recommended:
+    print("\nRecommended profiles:")
+    for name, profile in recommended.items():
+        print(f"{name}: {profile}")
+else:
+    print("\nNo profiles could be decoded; install UI dependencies to measure decode time")
+
+(out_dir / "output.json").write_text(
+    json.dumps(
+        {
+            "settings": {"decode_iterations": DECODE_ITERATIONS, "bandwidth": BANDWIDTH},
+            "results": json.loads(results.to_json(orient="records")),
+            "recommended": recommended,
+        },
+        indent=2,
+    )
+)
@@ -5,7 +5,7 @@ import warnings
 from databasin.client import Client
 from dotenv import load_dotenv, find_dotenv
 
-from analysis.databasin.lib import download_datasets
+from analysis.databasin.lib import fetch_datasets, merge_datasets
 
 warnings.filterwarnings("ignore", message=".*this will no longer exclude empty.*", category=FutureWarning)
 
@@ -62,6 +62,9 @@ PRESENCE_DATASET_IDS = [
     "4ed0c44b9b0046e585fe1d370e8f9cf8",  # 2026
 ]
 
+# set to True to fetch source dataset names again instead of using cached names
+REFRESH_METADATA = False
+
 
 load_dotenv(find_dotenv())
 DATABASIN_USER = os.getenv("DATABASIN_USER")
@@ -73,12 +76,32 @@ data_dir.mkdir(exist_ok=True, parents=True)
 client = Client()
 client.set_api_key(DATABASIN_USER, DATABASIN_KEY)
 
-print("Downloading activity datasets...")
-activity_df = download_datasets(client, ACTIVITY_DATASET_IDS)
+# download activity and presence-only datasets together
+print("Downloading activity and presence-only datasets...")
+# NOTE: each dataset is cached in cache_dir and only downloaded again if it was
+# modified in Data Basin (typically only the current year's datasets)
+cache_dir = data_dir / "datasets"
+cache_dir.mkdir(exist_ok=True)
+merged = fetch_datasets(client, ACTIVITY_DATASET_IDS + PRESENCE_DATASET_IDS, cache_dir=cache_dir)
+
+# NOTE: source dataset names are cached; set REFRESH_METADATA = True above to
+# force them to be fetched again
+metadata_filename = data_dir / "dataset_metadata.feather"
+
+activity_df = merge_datasets(
+    client,
+    merged[: len(ACTIVITY_DATASET_IDS)],
+    metadata_filename=metadata_filename,
+    refresh_metadata=REFRESH_METADATA,
+)
 activity_df.to_feather(data_dir / "activity_datasets.feather")
 print(f"Downloaded {len(activity_df):,} activity records")
 
-print("\n\nDownloading presence-only datasets...")
-presence_df = download_datasets(client, PRESENCE_DATASET_IDS)
+presence_df = merge_datasets(
+    client,
+    merged[len(ACTIVITY_DATASET_IDS) :],
+    metadata_filename=metadata_filename,
+    refresh_metadata=REFRESH_METADATA,
+)
 presence_df.to_feather(data_dir / "presence_datasets.feather")
 print(f"Downloaded {len(presence_df):,} presence-only records")
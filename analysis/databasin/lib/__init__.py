@@ -1,3 +1,3 @@
-from analysis.databasin.lib.datasets import download_datasets
+from analysis.databasin.lib.datasets import download_datasets, fetch_datasets, merge_datasets
 
-__all__ = [download_datasets]
+__all__ = [download_datasets, fetch_datasets, merge_datasets]
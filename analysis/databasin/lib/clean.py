@@ -1,7 +1,7 @@
 import numpy as np
-import shapely
 
 from analysis.constants import ACTIVITY_COLUMNS
+from analysis.lib.spatial import SpatialIndex
 from analysis.lib.util import from_camelcase
 
 
@@ -271,11 +271,8 @@ def clean_batamp(df, admin_df):
         df["myev"] = df[["myev", "myke"]].max(axis=1)
 
     # mark any bat detections in Hawaii as HABA (only species present)
-    ix = df.index.isin(
-        shapely.STRtree(df.geometry.values).query(
-            admin_df.loc[admin_df.admin1_name.str.contains("Hawaii")].geometry.values[0],
-            predicate="intersects",
-        )
+    ix = SpatialIndex(admin_df.loc[admin_df.admin1_name.str.contains("Hawaii")].geometry.values).intersects_points(
+        df.geometry.values
     )
     df.loc[ix, "haba"] = df.loc[ix, "bat"]
 
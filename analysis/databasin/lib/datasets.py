@@ -1,15 +1,91 @@
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import threading
+import time
 
+from databasin.exceptions import ForbiddenError, LoginRequiredError
 import geopandas as gp
 import pandas as pd
-from pyarrow.csv import read_csv
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow.csv import ConvertOptions, ReadOptions, open_csv
 import shapely
 
 from analysis.constants import GEO_CRS, ACTIVITY_COLUMNS
 
 
-def get_dataset_name(client, id):
-    """Get Data Basin dataset name, if possible.
+# NOTE: "bat" is a special group activity column used only to set haba in HI;
+# the others are outdated taxonomy columns that are merged into current species
+# during cleaning
+EXTRA_ACTIVITY_COLUMNS = ["bat", "labl", "lecu", "myke"]
+
+STRING_COLUMNS = [
+    "source_dataset",
+    "site_id",
+    "first_name",
+    "last_name",
+    "det_mfg",
+    "det_model",
+    "det_id",
+    "mic_type",
+    "mic_ht_units",
+    "refl_type",
+    "call_id_1",
+    "call_id_2",
+    "wthr_prof",
+]
+
+# explicit schema of columns read from CSV; all other columns are ignored
+# NOTE: activity columns are read as float64 to allow for negative values and
+# integral floats, and are converted to uint32 after reading each block;
+# night is read as string because it may include a time component or use a
+# non-ISO format
+CSV_SCHEMA = {
+    **{col: pa.string() for col in STRING_COLUMNS},
+    "db_longitude": pa.float64(),
+    "db_latitude": pa.float64(),
+    "mic_ht": pa.float64(),
+    "night": pa.string(),
+    **{col: pa.float64() for col in ACTIVITY_COLUMNS + EXTRA_ACTIVITY_COLUMNS},
+}
+
+CSV_BLOCK_SIZE = 1 << 22  # 4 MB
+
+# version of parsing and cleaning of downloaded datasets; cached datasets are
+# parsed again when this or CSV_SCHEMA changes
+# NOTE: this must be incremented whenever standardize_batch, parse_night, or
+# cleaning in download_dataset change the cached data
+PARSER_VERSION = 1
+
+# maximum age of cached dataset metadata; titles rarely change
+METADATA_TTL = pd.Timedelta(days=30)
+
+
+def clone_client(client):
+    """Create a new Data Basin client with the same host and credentials as client.
+
+    Data Basin clients are not thread-safe because they update the headers of a
+    shared session for each request, so each thread needs its own client.
+
+    Parameters
+    ----------
+    client : databasin.client.Client
+        or an object with the same interface
+
+    Returns
+    -------
+    databasin.client.Client
+        same type as client
+    """
+    out = type(client)()
+    out.base_url = client.base_url
+    out.set_api_key(client.username, client.api_key)
+    return out
+
+
+def get_dataset_metadata(client, id):
+    """Get Data Basin dataset title and whether it is blocked because of permissions.
 
     Parameters
     ----------
@@ -19,17 +95,225 @@ def get_dataset_name(client, id):
 
     Returns
     -------
-    str
-        dataset name or empty string if blocked because of permissions
+    dict
+        {"id": <id>, "title": <title>, "blocked": <bool>, "fetched": <timestamp>}
+        title is empty string if blocked because of permissions (will be handled
+        in UI tier); fetched is null if metadata could not be fetched for any
+        other reason, so that it is not cached
     """
     try:
-        return client.get_dataset(id).title
+        return {"id": id, "title": client.get_dataset(id).title, "blocked": False, "fetched": pd.Timestamp.now()}
+    except (ForbiddenError, LoginRequiredError):
+        return {"id": id, "title": "", "blocked": True, "fetched": pd.Timestamp.now()}
     except Exception:
-        # will be handled in UI tier
-        return ""
+        return {"id": id, "title": "", "blocked": False, "fetched": pd.NaT}
+
+
+def get_dataset_names(client, dataset_ids, cache_filename=None, ttl=METADATA_TTL, refresh=False, max_workers=4):
+    """Get Data Basin dataset names, using a local cache of dataset metadata
+    where available.
+
+    Metadata not present in the cache or older than ttl are fetched
+    concurrently and saved to the cache.
+
+    Parameters
+    ----------
+    client : databasin.client.Client
+    dataset_ids : list-like
+        list of dataset IDs
+    cache_filename : Path, optional (default: None)
+        Feather file used to cache dataset metadata; if None, metadata are not
+        cached
+    ttl : pd.Timedelta, optional (default: METADATA_TTL)
+        maximum age of cached metadata
+    refresh : bool, optional (default: False)
+        if True, fetch metadata for all datasets regardless of cache
+    max_workers : int, optional (default: 4)
+        maximum number of metadata requests to make at the same time
+
+    Returns
+    -------
+    Series
+        dataset name indexed by dataset ID
+    """
+    cache = pd.DataFrame(
+        {
+            "id": pd.Series(dtype="str"),
+            "title": pd.Series(dtype="str"),
+            "blocked": pd.Series(dtype="bool"),
+            "fetched": pd.Series(dtype="datetime64[us]"),
+        }
+    )
+    if cache_filename is not None and cache_filename.exists():
+        cache = pd.read_feather(cache_filename)
+
+    current = cache.loc[cache.fetched >= pd.Timestamp.now() - ttl] if not refresh else cache.iloc[:0]
+    cached_ids = set(current.id.values)
+    missing = [id for id in dataset_ids if id not in cached_ids]
+    print(f"Fetching metadata for {len(missing):,} datasets ({len(dataset_ids) - len(missing):,} cached)")
+
+    if missing:
+        local = threading.local()
+
+        def fetch(id):
+            if not hasattr(local, "client"):
+                local.client = clone_client(client)
+
+            return get_dataset_metadata(local.client, id)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fetched = pd.DataFrame(list(executor.map(fetch, missing)))
+
+        fetched["fetched"] = fetched.fetched.astype("datetime64[us]")
+
+        if cache_filename is not None:
+            cache = pd.concat(
+                [cache.loc[~cache.id.isin(fetched.id.values)], fetched.loc[fetched.fetched.notnull()]],
+                ignore_index=True,
+            )
+            cache.to_feather(cache_filename)
+
+        current = pd.concat([current, fetched], ignore_index=True)
+
+    return current.set_index("id").title.reindex(dataset_ids).fillna("").rename("dataset_name")
+
+
+def parse_night(values):
+    """Parse night values to timestamp, intentionally dropping any time component.
+
+    Parameters
+    ----------
+    values : pyarrow.Array
+        string values
+
+    Returns
+    -------
+    pyarrow.Array
+        timestamp[s] values
+    """
+    values = pc.list_element(pc.split_pattern(values, " ", max_splits=1), 0)
+    try:
+        return pc.cast(values, pa.timestamp("s"))
+    except pa.ArrowInvalid:
+        # not in ISO format; fall back to slower parsing in pandas
+        return pa.array(pd.to_datetime(values.to_pandas()).astype("datetime64[s]"), type=pa.timestamp("s"))
+
+
+def standardize_batch(batch):
+    """Standardize types in record batch read from Data Basin dataset CSV
+
+    Parameters
+    ----------
+    batch : pyarrow.RecordBatch
+
+    Returns
+    -------
+    pyarrow.RecordBatch
+    """
+    columns = {}
+    for name, values in zip(batch.schema.names, batch.columns):
+        if name in ACTIVITY_COLUMNS or name in EXTRA_ACTIVITY_COLUMNS:
+            # assume any negative values are typos
+            values = pc.cast(pc.abs(values), pa.uint32())
+        elif name == "night":
+            values = parse_night(values)
+
+        columns[name] = values
+
+    return pa.RecordBatch.from_pydict(columns)
+
+
+class TimedReader(object):
+    def __init__(self, source):
+        """Wrap a file-like object to measure the time spent waiting for and
+        the number of bytes returned by reads from it, e.g., when reading a
+        response while it is downloaded.
+
+        Parameters
+        ----------
+        source : file-like object
+        """
+        self.source = source
+        self.read_time = 0
+        self.bytes = 0
+
+    @property
+    def closed(self):
+        return self.source.closed
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self.source.read(size)
+        self.read_time += time.perf_counter() - start
+        self.bytes += len(data)
+        return data
+
+
+def read_dataset_csv(source, encoding="utf8"):
+    """Read Data Basin dataset CSV in blocks using an explicit schema.
+
+    Only the columns in CSV_SCHEMA are read; any that are missing from the
+    CSV are returned as all null values.
+
+    Parameters
+    ----------
+    source : file-like object
+    encoding : str, optional (default: "utf8")
+
+    Returns
+    -------
+    DataFrame
+    """
+    reader = open_csv(
+        source,
+        read_options=ReadOptions(block_size=CSV_BLOCK_SIZE, encoding=encoding),
+        convert_options=ConvertOptions(
+            column_types=CSV_SCHEMA, include_columns=list(CSV_SCHEMA.keys()), include_missing_columns=True
+        ),
+    )
+    schema = standardize_batch(pa.RecordBatch.from_pylist([], schema=reader.schema)).schema
+    table = pa.Table.from_batches([standardize_batch(batch) for batch in reader], schema=schema)
+
+    return table.to_pandas(types_mapper={pa.uint32(): pd.UInt32Dtype()}.get)
+
+
+def get_parser_version():
+    """Get version of parsing and cleaning of downloaded datasets that changes
+    whenever PARSER_VERSION or CSV_SCHEMA change
+
+    Returns
+    -------
+    str
+    """
+    schema_hash = hashlib.sha256(pa.schema(CSV_SCHEMA).to_string().encode("utf8")).hexdigest()[:16]
+    return f"{PARSER_VERSION}:{schema_hash}"
 
 
-def download_dataset(client, id):
+def get_dataset_version(dataset):
+    """Get version information for Data Basin dataset that changes whenever the
+    dataset is modified in Data Basin or the parsing and cleaning of downloaded
+    datasets changes
+
+    Parameters
+    ----------
+    dataset : databasin.datasets.DatasetResource
+
+    Returns
+    -------
+    dict
+    """
+    return {
+        "modify_date": dataset.modify_date,
+        "version": dataset.version,
+        "file_size": dataset.file_size,
+        "parser": get_parser_version(),
+    }
+
+
+def download_dataset(client, id, cache_dir=None):
     """Download Data Basin dataset and standardize fields
 
     Parameters
@@ -37,6 +321,10 @@ def download_dataset(client, id):
     client : databasin.client.Client
     id : str
         dataset ID
+    cache_dir : Path, optional (default: None)
+        if present, the standardized dataset is cached in this directory and
+        reused instead of being downloaded again until the dataset is modified
+        in Data Basin or PARSER_VERSION or CSV_SCHEMA change
 
     Returns
     -------
@@ -50,45 +338,46 @@ def download_dataset(client, id):
         print(f"ERROR: cannot download data for {dataset.id} - no download permissions")
         return None
 
-    data = dataset.data
-    df = (
-        read_csv(BytesIO(data.encode("UTF-8")))
-        .to_pandas()
-        .rename(
-            columns={"db_longitude": "lon", "db_latitude": "lat", "source_dataset": "dataset", "site_id": "site_name"}
-        )
+    # datasets for prior years are rarely modified; reuse cached copy if
+    # dataset has not been modified since it was cached
+    if cache_dir is not None:
+        version = get_dataset_version(dataset)
+        filename = cache_dir / f"{id}.feather"
+        version_filename = cache_dir / f"{id}.json"
+
+        if filename.exists() and version_filename.exists() and json.loads(version_filename.read_text()) == version:
+            print(f"Using cached copy of {id} (last modified {dataset.modify_date})")
+            return gp.read_feather(filename)
+
+    # stream response directly into CSV reader instead of reading it into a string
+    # NOTE: the response is parsed while it is downloaded, so only the time
+    # spent waiting for the response can be measured separately from the total
+    start = time.time()
+    response = client.get(client.build_url(f"/api/v1/datasets/{id}/data/"), stream=True)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    source = TimedReader(response.raw)
+    df = read_dataset_csv(source, encoding=response.encoding or "utf8").rename(
+        columns={"db_longitude": "lon", "db_latitude": "lat", "source_dataset": "dataset", "site_id": "site_name"}
+    )
+    print(
+        f"Downloaded and parsed {len(df):,} records ({source.bytes / 1e6:.2f} MB) for {id} in {time.time() - start:.2f}s "
+        f"({source.read_time:.2f}s waiting for response)"
     )
-
-    # make sure to add "haba" in case it is not already present
-    # NOTE: these may get dropped after merge if all datasets are lacking these columns
-    # NOTE: "bat" is a special group activity column used only to set haba in HI
-    activity_cols = ACTIVITY_COLUMNS + ["bat"]
-    for col in activity_cols:
-        if col not in df.columns:
-            df[col] = pd.NA
-
-        else:
-            # assume any negative values are typos
-            df[col] = df[col].fillna(pd.NA).abs()
-
-        df[col] = df[col].astype("UInt32")
 
     ### Cleanup and standardize dataset
     # Drop completely null records
+    # NOTE: activity columns may be all null if not present in the dataset; these
+    # may get dropped after merge if all datasets are lacking these columns
+    activity_cols = ACTIVITY_COLUMNS + ["bat"]
     df = df.dropna(axis=0, how="all", subset=activity_cols)
 
     df["geometry"] = shapely.points(df.lon.values, df.lat.values)
     df = gp.GeoDataFrame(df, geometry="geometry", crs=GEO_CRS)
 
-    # night is automatically parsed to datetime by pyarrow when possible, extract other fields
-    if df.night.dtype == object:
-        df["night"] = pd.to_datetime(df.night.astype(str).apply(lambda d: d.split(" ")[0]))
-    df["night"] = df.night.astype("datetime64[s]")
-
     # Convert height units to meters
     ix = df.mic_ht_units == "feet"
     df.loc[ix, "mic_ht"] = df.loc[ix].mic_ht * 0.3048
-    df.loc[ix, "mic_ht_units"] = "meters"
     df["mic_ht"] = df.mic_ht.astype("float32")
 
     for col in [
@@ -104,14 +393,11 @@ def download_dataset(client, id):
         "det_id",
         "wthr_prof",  # sometimes absent from datasets
     ]:
-        if col in df.columns:
-            df[col] = df[col].fillna("").str.strip()
+        df[col] = df[col].fillna("").str.strip()
 
-            if col != "refl_type":
-                # none has special meaning for refl_type but indicates missing data for the rest
-                df.loc[df[col].str.lower() == "none", [col]] = ""
-        else:
-            df[col] = ""
+        if col != "refl_type":
+            # none has special meaning for refl_type but indicates missing data for the rest
+            df.loc[df[col].str.lower() == "none", [col]] = ""
 
     df["refl_type"] = df.refl_type.replace("Nothing", "none")
 
@@ -120,8 +406,6 @@ def download_dataset(client, id):
     # drop unneeded columns
     df = df.drop(
         columns=[
-            "x_coord",
-            "y_coord",
             "mic_ht_units",
             "first_name",
             "last_name",
@@ -130,40 +414,102 @@ def download_dataset(client, id):
         ]
     )
 
+    if cache_dir is not None:
+        df.to_feather(filename)
+        version_filename.write_text(json.dumps(version))
+
     return df
 
 
-def download_datasets(client, dataset_ids):
-    """Download Data Basin datasets
+def fetch_datasets(client, dataset_ids, max_workers=4, cache_dir=None):
+    """Download Data Basin datasets concurrently using a pool of threads.
 
     Parameters
     ----------
     client : databasin.client.Client
     dataset_ids : list-like
         list of dataset IDs
+    max_workers : int, optional (default: 4)
+        maximum number of datasets to download at the same time
+    cache_dir : Path, optional (default: None)
+        if present, datasets are cached in this directory and only downloaded
+        again when modified in Data Basin
 
     Returns
     -------
-    GeoDataFrame
+    list of DataFrames
+        one per dataset, in same order as dataset_ids; None if the dataset
+        could not be downloaded
     """
-    merged = None
-    for id in dataset_ids:
-        df = download_dataset(client, id)
-        if df is None:
-            continue
+    local = threading.local()
+
+    def fetch(id):
+        if not hasattr(local, "client"):
+            local.client = clone_client(client)
+
+        start = time.time()
+        df = download_dataset(local.client, id, cache_dir=cache_dir)
+        print(f"Fetched {id} in {time.time() - start:.2f}s")
+        return df
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # results are returned in same order as dataset_ids
+        return list(executor.map(fetch, dataset_ids))
+
 
-        if merged is None:
-            merged = df
-        else:
-            merged = pd.concat([merged, df], ignore_index=True)
+def merge_datasets(client, merged, metadata_filename=None, refresh_metadata=False):
+    """Merge downloaded Data Basin datasets and add source dataset names
 
-    df = merged.reset_index(drop=True)
+    Parameters
+    ----------
+    client : databasin.client.Client
+    merged : list of DataFrames
+        as returned by fetch_datasets
+    metadata_filename : Path, optional (default: None)
+        Feather file used to cache source dataset metadata
+    refresh_metadata : bool, optional (default: False)
+        if True, fetch metadata for all source datasets regardless of cache
+
+    Returns
+    -------
+    GeoDataFrame
+    """
+    # concatenate all datasets at once to avoid recopying previously merged datasets
+    df = pd.concat([df for df in merged if df is not None], ignore_index=True)
 
     # fetch all source dataset names
     print("Getting source dataset names")
-    dataset_names = pd.DataFrame({"id": df.dataset.unique()})
-    dataset_names["dataset_name"] = dataset_names.id.apply(lambda id: get_dataset_name(client, id))
+    dataset_names = get_dataset_names(
+        client, df.dataset.unique().tolist(), cache_filename=metadata_filename, refresh=refresh_metadata
+    )
 
-    df = df.join(dataset_names.set_index("id"), on="dataset")
+    df = df.join(dataset_names, on="dataset")
 
     return df
+
+
+def download_datasets(client, dataset_ids, max_workers=4, cache_dir=None, metadata_filename=None):
+    """Download Data Basin datasets
+
+    Parameters
+    ----------
+    client : databasin.client.Client
+    dataset_ids : list-like
+        list of dataset IDs
+    max_workers : int, optional (default: 4)
+        maximum number of datasets to download at the same time
+    cache_dir : Path, optional (default: None)
+        if present, datasets are cached in this directory and only downloaded
+        again when modified in Data Basin
+    metadata_filename : Path, optional (default: None)
+        Feather file used to cache source dataset metadata
+
+    Returns
+    -------
+    GeoDataFrame
+    """
+    return merge_datasets(
+        client,
+        fetch_datasets(client, dataset_ids, max_workers=max_workers, cache_dir=cache_dir),
+        metadata_filename=metadata_filename,
+    )
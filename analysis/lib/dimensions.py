@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from analysis.lib.ids import allocate_ids
+from analysis.lib.util import explode_unique
+
+
+def create_dimension(groups, values, filename, sep=","):
+    """Normalize delimited values (e.g., contributors) into a table of unique
+    individual values with stable integer IDs, and links from each group to
+    the IDs of its values.
+
+    Parameters
+    ----------
+    groups : Series
+        group of each value, e.g., detector ID
+    values : Series
+        delimited string values, aligned to groups
+    filename : Path
+        registry of IDs assigned to each unique value; see allocate_ids
+    sep : str, optional (default: ",")
+        delimiter used to split values
+
+    Returns
+    -------
+    tuple of (DataFrame, DataFrame)
+        table of "id" and "name", sorted by name, and links of "group" and "id";
+        links of each group are contiguous and sorted by name
+    """
+    links = explode_unique(groups, values, sep=sep)
+    names = pd.Series(np.sort(links.value.unique()))
+    table = pd.DataFrame({"id": allocate_ids(names, filename), "name": names})
+    links = pd.DataFrame({"group": links.group.values, "id": links.value.map(table.set_index("name").id).values})
+
+    return table, links
+
+
+def to_link_arrays(links, index):
+    """Collect the linked IDs of each group into an array
+
+    Parameters
+    ----------
+    links : DataFrame
+        "group" and "id"; links of each group must be contiguous
+    index : Index
+        groups to include; groups without links are given empty arrays
+
+    Returns
+    -------
+    Series
+        arrays of IDs indexed by group
+    """
+    empty = np.array([], dtype=links.id.dtype)
+    if len(links) == 0:
+        return pd.Series([empty] * len(index), index=index, dtype="object")
+
+    values = links.group.values
+    start = np.concatenate([[0], np.flatnonzero(values[1:] != values[:-1]) + 1])
+    arrays = pd.Series(np.split(links.id.values, start[1:]), index=values[start], dtype="object").reindex(index)
+
+    missing = arrays.isnull()
+    arrays[missing] = pd.Series([empty] * missing.sum(), index=arrays.index[missing], dtype="object")
+
+    return arrays
@@ -0,0 +1,118 @@
+from h3ronpy import change_resolution
+from h3ronpy.vector import coordinates_to_cells, cells_to_wkb_polygons
+import numpy as np
+import pyarrow as pa
+from pyarrow.feather import read_table, write_feather
+
+
+def assign_cells(lat, lon, levels):
+    """Assign points to H3 cells at each level.
+
+    Points are assigned to cells only at the finest level; cells at coarser
+    levels are the parents of those cells, so that every cell at a coarser
+    level contains the cells of its points at finer levels.
+
+    Parameters
+    ----------
+    lat : ndarray
+    lon : ndarray
+    levels : list-like of int
+        H3 levels
+
+    Returns
+    -------
+    dict
+        {<level>: (<ndarray of unique cells sorted ascending>, <ndarray of index into cells for each point>), ...}
+    """
+    finest = max(levels)
+    cells, index = np.unique(np.asarray(coordinates_to_cells(lat, lon, finest)), return_inverse=True)
+
+    out = {}
+    for level in levels:
+        if level == finest:
+            out[level] = (cells, index)
+            continue
+
+        # only look up parents of unique cells, then map back to points
+        parents = np.asarray(change_resolution(pa.array(cells), level))
+        if len(parents) != len(cells):
+            raise ValueError(f"could not find parents at H3 level {level} for all cells")
+
+        parent_cells, parent_index = np.unique(parents, return_inverse=True)
+        out[level] = (parent_cells, parent_index[index])
+
+    return out
+
+
+def get_cell_polygons(cells, cache_filename):
+    """Get polygons of H3 cells as WKB.
+
+    Polygons are cached by cell in cache_filename; only polygons for cells not
+    already in the cache are created, and then added to the cache.
+
+    Parameters
+    ----------
+    cells : ndarray of uint64
+    cache_filename : Path
+
+    Returns
+    -------
+    ndarray of WKB bytes, in same order as cells
+    """
+    if cache_filename.exists():
+        cache = read_table(cache_filename)
+        cached_cells = cache["cell"].to_numpy()
+        cached_wkb = cache["geometry"].to_numpy(zero_copy_only=False)
+    else:
+        cached_cells = np.array([], dtype="uint64")
+        cached_wkb = np.array([], dtype="object")
+
+    missing = np.setdiff1d(cells, cached_cells)
+    if len(missing):
+        print(f"Creating polygons for {len(missing):,} new H3 cells")
+        cached_cells = np.concatenate([cached_cells, missing])
+        cached_wkb = np.concatenate(
+            [cached_wkb, pa.array(cells_to_wkb_polygons(pa.array(missing))).to_numpy(zero_copy_only=False)]
+        )
+
+        order = np.argsort(cached_cells)
+        cached_cells = cached_cells[order]
+        cached_wkb = cached_wkb[order]
+
+        write_feather(
+            pa.Table.from_arrays(
+                [pa.array(cached_cells, type=pa.uint64()), pa.array(cached_wkb, type=pa.binary())],
+                names=["cell", "geometry"],
+            ),
+            cache_filename,
+        )
+
+    return cached_wkb[np.searchsorted(cached_cells, cells)]
+
+
+def write_hexes(df, filename):
+    """Write hexes to a feather file, unless the file already contains the same
+    cells and IDs.
+
+    Parameters
+    ----------
+    df : GeoDataFrame
+        must include "id" and "cell" columns
+    filename : Path
+
+    Returns
+    -------
+    bool
+        True if file was written
+    """
+    if filename.exists():
+        existing = read_table(filename)
+        if (
+            "cell" in existing.column_names
+            and np.array_equal(existing["cell"].to_numpy(), df.cell.values)
+            and np.array_equal(existing["id"].to_numpy(), df.id.values)
+        ):
+            return False
+
+    df.to_feather(filename)
+    return True
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+
+# IDs are read as JavaScript numbers in the UI; 64-bit integers would be read
+# as BigInt, so IDs are limited to 32 bits
+ID_DTYPES = ["uint8", "uint16", "uint32"]
+# used where a signed type is required, e.g., for feature IDs in tiles
+SIGNED_ID_DTYPES = ["int8", "int16", "int32"]
+
+
+def get_id_dtype(max_id, max_dtype="uint32"):
+    """Get the narrowest integer type that can hold max_id, with the same
+    signedness as max_dtype
+
+    Parameters
+    ----------
+    max_id : int
+    max_dtype : str, optional (default: "uint32")
+        widest allowed type; must be one of ID_DTYPES or SIGNED_ID_DTYPES
+
+    Returns
+    -------
+    str
+        dtype; signed if max_dtype is signed
+
+    Raises
+    ------
+    ValueError
+        if max_dtype is not an allowed type
+    OverflowError
+        if max_id does not fit in max_dtype
+    """
+    if max_dtype in ID_DTYPES:
+        dtypes = ID_DTYPES[: ID_DTYPES.index(max_dtype) + 1]
+    elif max_dtype in SIGNED_ID_DTYPES:
+        dtypes = SIGNED_ID_DTYPES[: SIGNED_ID_DTYPES.index(max_dtype) + 1]
+    else:
+        raise ValueError(f"max_dtype must be one of {', '.join(ID_DTYPES + SIGNED_ID_DTYPES)}")
+
+    if max_id > np.iinfo(max_dtype).max:
+        raise OverflowError(f"ID {max_id:,} exceeds maximum value for {max_dtype} ({np.iinfo(max_dtype).max:,})")
+
+    for dtype in dtypes:
+        if max_id <= np.iinfo(dtype).max:
+            return dtype
+
+
+def allocate_ids(keys, filename, max_dtype="uint32"):
+    """Allocate stable integer IDs for unique keys.
+
+    IDs start at 1 and are stored by key in filename. Keys that were assigned an
+    ID in a previous run keep that ID; new keys are assigned new IDs in the order
+    they are provided. IDs of keys that are no longer present are never reused.
+
+    IDs are returned using the narrowest integer type that can hold all IDs
+    allocated so far, with the same signedness as max_dtype.
+
+    Parameters
+    ----------
+    keys : Series or ndarray
+        unique keys that identify each entity, e.g., point ID or H3 cell
+    filename : Path
+        feather file that stores IDs allocated by key
+    max_dtype : str, optional (default: "uint32")
+        widest allowed type for IDs; see get_id_dtype
+
+    Returns
+    -------
+    ndarray
+        ID for each key
+
+    Raises
+    ------
+    OverflowError
+        if the number of IDs allocated exceeds the maximum value of max_dtype
+    """
+    keys = pd.Index(keys)
+    if not keys.is_unique:
+        raise ValueError("keys must be unique to allocate IDs")
+
+    if filename.exists():
+        allocated = pd.read_feather(filename)
+    else:
+        allocated = pd.DataFrame({"key": keys[:0], "id": np.array([], dtype="uint64")})
+
+    ix = pd.Index(allocated.key).get_indexer(keys)
+    new = ix == -1
+
+    ids = np.zeros(len(keys), dtype="uint64")
+    ids[~new] = allocated.id.values[ix[~new]]
+
+    if new.any():
+        start = int(allocated.id.max()) + 1 if len(allocated) else 1
+        ids[new] = np.arange(start, start + new.sum(), dtype="uint64")
+        allocated = pd.concat(
+            [allocated, pd.DataFrame({"key": keys[new], "id": ids[new]})],
+            ignore_index=True,
+        )
+
+    # check before saving so that IDs beyond the allowed range are never stored
+    dtype = get_id_dtype(int(allocated.id.max()) if len(allocated) else 0, max_dtype)
+
+    if new.any():
+        filename.parent.mkdir(exist_ok=True, parents=True)
+        allocated.to_feather(filename)
+
+    return ids.astype(dtype)
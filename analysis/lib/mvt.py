@@ -0,0 +1,469 @@
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import hashlib
+import multiprocessing
+import os
+from pathlib import Path
+import time
+
+import numpy as np
+import shapely
+from pmtiles.tile import Compression, TileType, zxy_to_tileid
+from pmtiles.writer import Writer
+
+from analysis.lib.tiles import add_tileset_to_cache, get_cached_tileset, hash_features
+
+
+# tile coordinates are quantized to this many units per tile
+EXTENT = 4096
+# features are clipped to this many units outside each tile; this is the same as
+# the default buffer of 5 pixels (out of 256) used by tippecanoe
+BUFFER = 80
+MAX_LAT = 85.0511287798066
+
+# MVT geometry commands
+MOVE_TO = 1 | (1 << 3)
+LINE_TO = 2
+CLOSE_PATH = 7 | (1 << 3)
+POLYGON = 3
+
+
+# geometries shared with worker processes; set by _init_worker
+_coords = None
+_offsets = None
+_ids = None
+_layers = None
+
+
+def project(lon, lat):
+    """Project longitude and latitude to Web Mercator coordinates normalized to
+    0-1, with the origin at the top left
+
+    Parameters
+    ----------
+    lon : ndarray
+    lat : ndarray
+
+    Returns
+    -------
+    tuple of (ndarray, ndarray)
+    """
+    lat = np.radians(np.clip(lat, -MAX_LAT, MAX_LAT))
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return x, y
+
+
+def encode_varints(values):
+    """Encode unsigned integers as protobuf varints
+
+    Parameters
+    ----------
+    values : ndarray of uint64
+
+    Returns
+    -------
+    tuple of (ndarray of uint8, ndarray)
+        encoded bytes of all values and number of bytes used for each value
+    """
+    values = np.asarray(values, dtype="uint64")
+    num_bytes = np.ones(len(values), dtype="int64")
+    for bits in range(7, 64, 7):
+        num_bytes += values >= np.uint64(1 << bits)
+
+    starts = np.cumsum(num_bytes) - num_bytes
+    out = np.empty(num_bytes.sum(), dtype="uint8")
+    for i in range(num_bytes.max(initial=0)):
+        ix = num_bytes > i
+        byte = (values[ix] >> np.uint64(7 * i)) & np.uint64(0x7F)
+        # set continuation bit on all but the last byte of each value
+        out[starts[ix] + i] = byte | np.where(num_bytes[ix] > i + 1, 0x80, 0).astype("uint64")
+
+    return out, num_bytes
+
+
+def concat_fields(fields, count):
+    """Concatenate variable-length byte fields of each record into a single
+    buffer, with the fields of each record in order
+
+    Parameters
+    ----------
+    fields : list of bytes or (ndarray of uint8, ndarray) tuples
+        bytes are repeated for every record; tuples are the bytes of all records
+        and number of bytes for each record
+    count : int
+        number of records
+
+    Returns
+    -------
+    tuple of (ndarray of uint8, ndarray)
+        bytes of all records and number of bytes for each record
+    """
+    fields = [
+        (np.tile(np.frombuffer(field, dtype="uint8"), count), np.full(count, len(field)))
+        if isinstance(field, bytes)
+        else field
+        for field in fields
+    ]
+
+    record_len = np.sum([lengths for _, lengths in fields], axis=0, dtype="int64")
+    offset = np.cumsum(record_len) - record_len
+    out = np.empty(record_len.sum(), dtype="uint8")
+    for data, lengths in fields:
+        src_start = np.cumsum(lengths) - lengths
+        out[np.repeat(offset - src_start, lengths) + np.arange(len(data))] = data
+        offset += lengths
+
+    return out, record_len
+
+
+def varint(value):
+    """Encode a single unsigned integer as a protobuf varint
+
+    Parameters
+    ----------
+    value : int
+
+    Returns
+    -------
+    bytes
+    """
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_rings(coords, coord_ring, ring_feature, num_features):
+    """Quantize polygon rings to integer tile coordinates and encode them as
+    MVT geometry commands.
+
+    Rings are snapped to integer coordinates, duplicate vertices are removed,
+    and rings that collapse to zero area are dropped. All rings are treated as
+    exterior rings and oriented so that they are clockwise in tile coordinates.
+
+    Parameters
+    ----------
+    coords : ndarray of shape (n, 2)
+        coordinates of all rings in tile coordinates, including the closing
+        coordinate of each ring
+    coord_ring : ndarray
+        ring index of each coordinate
+    ring_feature : ndarray
+        feature index of each ring, in ascending order
+    num_features : int
+
+    Returns
+    -------
+    tuple of (ndarray of uint8, ndarray)
+        encoded geometry of all features and number of bytes for each feature;
+        features without any remaining rings have 0 bytes
+    """
+    coords = np.rint(coords).astype("int64")
+
+    # drop closing coordinate of each ring; this is implied by ClosePath
+    closing = np.ones(len(coords), dtype="bool")
+    closing[:-1] = coord_ring[1:] != coord_ring[:-1]
+    coords = coords[~closing]
+    coord_ring = coord_ring[~closing]
+
+    # drop vertices that are the same as the previous vertex of the ring
+    ring_size = np.bincount(coord_ring, minlength=len(ring_feature))
+    ring_start = (np.cumsum(ring_size) - ring_size)[ring_size > 0]
+    ring_end = np.cumsum(ring_size)[ring_size > 0]
+    prev_ix = np.arange(-1, len(coords) - 1)
+    prev_ix[ring_start] = ring_end - 1
+    keep = np.any(coords != coords[prev_ix], axis=1)
+    coords = coords[keep]
+    coord_ring = coord_ring[keep]
+
+    ring_size = np.bincount(coord_ring, minlength=len(ring_feature))
+    ring_start = np.cumsum(ring_size) - ring_size
+    ring_end = ring_start + ring_size
+    next_ix = np.arange(1, len(coords) + 1)
+    next_ix[ring_end[ring_size > 0] - 1] = ring_start[ring_size > 0]
+
+    # area is positive for rings that are clockwise in tile coordinates
+    # (y increases downward); reverse the rest and drop collapsed rings
+    cross = coords[:, 0] * coords[next_ix, 1] - coords[next_ix, 0] * coords[:, 1]
+    area = np.bincount(coord_ring, weights=cross, minlength=len(ring_feature))
+    reverse = (area < 0)[coord_ring]
+    ix = np.arange(len(coords))
+    ix[reverse] = (ring_start + ring_end - 1)[coord_ring[reverse]] - ix[reverse]
+    keep = (area != 0)[coord_ring]
+    coords = coords[ix][keep]
+    coord_ring = coord_ring[keep]
+    ring_feature = ring_feature[area != 0]
+    coord_ring = np.cumsum(area != 0)[coord_ring] - 1
+    ring_size = np.bincount(coord_ring, minlength=len(ring_feature))
+
+    # coordinates are encoded relative to previous coordinate of same feature
+    coord_feature = ring_feature[coord_ring]
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype="int64"))
+    first = np.ones(len(coords), dtype="bool")
+    first[1:] = coord_feature[1:] != coord_feature[:-1]
+    deltas[first] = coords[first]
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).astype("uint64")
+
+    # each ring is encoded as MoveTo(1) x y LineTo(n-1) x y ... ClosePath
+    ring_len = 2 * ring_size + 3
+    ring_start = np.cumsum(ring_len) - ring_len
+    out = np.empty(ring_len.sum(), dtype="uint64")
+    out[ring_start] = MOVE_TO
+    out[ring_start + 3] = LINE_TO | ((ring_size - 1) << 3)
+    out[ring_start + ring_len - 1] = CLOSE_PATH
+
+    coord_start = np.cumsum(ring_size) - ring_size
+    local = np.arange(len(coords)) - coord_start[coord_ring]
+    pos = ring_start[coord_ring] + 2 * local + np.where(local == 0, 1, 2)
+    out[pos] = zigzag[:, 0]
+    out[pos + 1] = zigzag[:, 1]
+
+    encoded, num_bytes = encode_varints(out)
+    feature_bytes = np.bincount(np.repeat(ring_feature, ring_len), weights=num_bytes, minlength=num_features)
+
+    return encoded, feature_bytes.astype("int64")
+
+
+def _init_worker(coords, offsets, ids, layers):
+    global _coords, _offsets, _ids, _layers
+    _coords = coords
+    _offsets = offsets
+    _ids = ids
+    _layers = layers
+
+
+def _build_tiles(tile_ids, geom_ix, z, x, y):
+    """Clip, quantize, and encode features into gzip-compressed MVT tiles.
+
+    Inputs are one entry per feature per tile, sorted by tile ID and then
+    geometry index (which is ordered by layer).
+
+    Returns
+    -------
+    list of (int, bytes)
+        tile ID and tile data
+    """
+    # gather coordinates of each feature and transform to tile coordinates
+    starts = _offsets[geom_ix]
+    counts = _offsets[geom_ix + 1] - starts
+    feature = np.repeat(np.arange(len(geom_ix)), counts)
+    ix = np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    scale = np.power(2.0, z)[feature]
+    coords = _coords[ix]
+    coords[:, 0] = (coords[:, 0] * scale - x[feature]) * EXTENT
+    coords[:, 1] = (coords[:, 1] * scale - y[feature]) * EXTENT
+
+    geometries = shapely.polygons(shapely.linearrings(coords, indices=feature))
+    geometries = shapely.clip_by_rect(geometries, -BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER)
+    parts, part_feature = shapely.get_parts(geometries, return_index=True)
+    coords, coord_ring = shapely.get_coordinates(shapely.get_exterior_ring(parts), return_index=True)
+    geometry, geometry_bytes = encode_rings(coords, coord_ring, part_feature, len(geom_ix))
+
+    keep = geometry_bytes > 0
+    tile_ids = tile_ids[keep]
+    geom_ix = geom_ix[keep]
+    geometry_bytes = geometry_bytes[keep]
+    count = len(geom_ix)
+
+    features = concat_fields(
+        [
+            b"\x08",
+            encode_varints(_ids[geom_ix]),
+            b"\x18\x03\x22",
+            encode_varints(geometry_bytes),
+            (geometry, geometry_bytes),
+        ],
+        count,
+    )
+    # each feature is a length-delimited field of its layer
+    features, feature_bytes = concat_fields([b"\x12", encode_varints(features[1]), features], count)
+    features = features.tobytes()
+    feature_end = np.cumsum(feature_bytes)
+
+    # features of the same layer in the same tile are contiguous
+    layer_ix = np.searchsorted(_layers["offset"], geom_ix, side="right") - 1
+    new_group = np.ones(count, dtype="bool")
+    new_group[1:] = (tile_ids[1:] != tile_ids[:-1]) | (layer_ix[1:] != layer_ix[:-1])
+    group_start = np.flatnonzero(new_group)
+    group_end = np.append(group_start[1:], count) - 1
+
+    names = [name.encode("utf8") for name in _layers["name"]]
+    out = []
+    tile = []
+    for start, end in zip(group_start.tolist(), group_end.tolist()):
+        name = names[layer_ix[start]]
+        layer = (
+            b"\x78\x02"  # version
+            + b"\x0a"
+            + varint(len(name))
+            + name
+            + features[feature_end[start] - feature_bytes[start] : feature_end[end]]
+            + b"\x28"
+            + varint(EXTENT)
+        )
+        tile.append(b"\x1a" + varint(len(layer)) + layer)
+
+        if end == count - 1 or tile_ids[end + 1] != tile_ids[end]:
+            out.append((int(tile_ids[end]), gzip.compress(b"".join(tile), mtime=0)))
+            tile = []
+
+    return out
+
+
+def create_polygon_tileset(layers, outfilename, max_workers=None, cache_dir=None):
+    """Create a multi-layer PMTiles tileset of simple polygons with integer IDs.
+
+    Tiles are built in parallel processes without using tippecanoe: features are
+    assigned to every tile they overlap at each zoom level of their layer,
+    clipped to a small buffer around each tile, and quantized to tile
+    coordinates. Features are not simplified or dropped at lower zoom levels,
+    so this is only appropriate for polygons that are not much smaller than a
+    tile pixel within the zoom range of their layer, such as H3 hexagons.
+
+    Parameters
+    ----------
+    layers : list of dict
+        [{"name": <layer name>, "df": <GeoDataFrame>, "minzoom": <int>, "maxzoom": <int>}, ...];
+        each GeoDataFrame must have an integer "id" column, which is used as
+        feature ID, and no other attributes. Layers are written to each tile
+        in this order.
+    outfilename : Path or str
+        name of output *.pmtiles tileset
+    max_workers : int, optional (default: None)
+        maximum number of processes used to build tiles; defaults to number of
+        CPUs
+    cache_dir : Path, optional (default: None)
+        if present, tilesets are cached in this directory by a hash of the
+        features, names, and zoom levels of each layer and are only created
+        again if any of those change
+
+    Returns
+    -------
+    dict
+        {"tileset": <name>, "cached": <bool>, "elapsed": <seconds>, "tiles": <number of tiles>}
+    """
+    info = {"tileset": Path(outfilename).name, "cached": False, "elapsed": 0, "tiles": 0}
+
+    for layer in layers:
+        extra_cols = set(layer["df"].columns) - {"id", layer["df"].geometry.name}
+        if "id" not in layer["df"].columns or extra_cols:
+            raise ValueError(f"layer {layer['name']} must have only an id column and geometry")
+
+    if cache_dir is not None:
+        h = hashlib.sha256(f"{EXTENT}\0{BUFFER}".encode("utf8"))
+        for layer in layers:
+            h.update(hash_features(layer["df"]))
+            h.update("\0".join([layer["name"], str(layer["minzoom"]), str(layer["maxzoom"])]).encode("utf8"))
+        key = h.hexdigest()
+
+        if get_cached_tileset(cache_dir, key, outfilename):
+            print(f"Using cached tileset for {info['tileset']}")
+            info["cached"] = True
+            return info
+
+    start = time.time()
+
+    # project exterior rings of all layers to normalized Web Mercator
+    geometries = np.concatenate([layer["df"].geometry.values.to_crs("EPSG:4326") for layer in layers])
+    coords, coord_ix = shapely.get_coordinates(shapely.get_exterior_ring(geometries), return_index=True)
+    coords = np.stack(project(coords[:, 0], coords[:, 1]), axis=1)
+    offsets = np.zeros(len(geometries) + 1, dtype="int64")
+    offsets[1:] = np.cumsum(np.bincount(coord_ix, minlength=len(geometries)))
+    ids = np.concatenate([layer["df"]["id"].values.astype("uint64") for layer in layers])
+    layer_offsets = np.cumsum([0] + [len(layer["df"]) for layer in layers])
+
+    xmin, xmax = np.minimum.reduceat(coords[:, 0], offsets[:-1]), np.maximum.reduceat(coords[:, 0], offsets[:-1])
+    ymin, ymax = np.minimum.reduceat(coords[:, 1], offsets[:-1]), np.maximum.reduceat(coords[:, 1], offsets[:-1])
+
+    # find every tile overlapped by each feature at each zoom level of its layer
+    buffer = BUFFER / EXTENT
+    tiles = []
+    for i, layer in enumerate(layers):
+        ix = np.arange(layer_offsets[i], layer_offsets[i + 1])
+        for z in range(layer["minzoom"], layer["maxzoom"] + 1):
+            scale = 2**z
+            x0 = np.clip(np.floor(xmin[ix] * scale - buffer), 0, scale - 1).astype("int64")
+            x1 = np.clip(np.floor(xmax[ix] * scale + buffer), 0, scale - 1).astype("int64")
+            y0 = np.clip(np.floor(ymin[ix] * scale - buffer), 0, scale - 1).astype("int64")
+            y1 = np.clip(np.floor(ymax[ix] * scale + buffer), 0, scale - 1).astype("int64")
+            width = x1 - x0 + 1
+            counts = width * (y1 - y0 + 1)
+            feature = np.repeat(np.arange(len(ix)), counts)
+            local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            tiles.append(
+                (
+                    ix[feature],
+                    np.full(len(feature), z),
+                    x0[feature] + local % width[feature],
+                    y0[feature] + local // width[feature],
+                )
+            )
+
+    geom_ix, z, x, y = (np.concatenate(values) for values in zip(*tiles))
+
+    # PMTiles tile IDs follow a Hilbert curve within each zoom level
+    zxy, zxy_ix = np.unique((z << 48) | (x << 24) | y, return_inverse=True)
+    tile_ids = np.array(
+        [zxy_to_tileid(tile >> 48, (tile >> 24) & 0xFFFFFF, tile & 0xFFFFFF) for tile in zxy.tolist()], dtype="uint64"
+    )[zxy_ix]
+
+    order = np.lexsort((geom_ix, tile_ids))
+    tile_ids, geom_ix, z, x, y = tile_ids[order], geom_ix[order], z[order], x[order], y[order]
+
+    # split into contiguous ranges of tiles so that tiles are written in order
+    num_workers = max_workers or os.cpu_count()
+    boundaries = np.flatnonzero(tile_ids[1:] != tile_ids[:-1]) + 1
+    chunk_size = max(len(tile_ids) // (num_workers * 4), 1)
+    split_ix = np.searchsorted(boundaries, np.arange(chunk_size, len(tile_ids), chunk_size))
+    splits = np.unique(boundaries[split_ix[split_ix < len(boundaries)]])
+    chunks = [np.split(values, splits) for values in (tile_ids, geom_ix, z, x, y)]
+
+    with (
+        ProcessPoolExecutor(
+            max_workers=max_workers,
+            # use fork so that workers do not import the calling script again
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(coords, offsets, ids, {"name": [layer["name"] for layer in layers], "offset": layer_offsets}),
+        ) as executor,
+        open(outfilename, "wb") as out,
+    ):
+        writer = Writer(out)
+        for built in executor.map(_build_tiles, *chunks):
+            for tile_id, data in built:
+                writer.write_tile(tile_id, data)
+                info["tiles"] += 1
+
+        bounds = shapely.total_bounds(geometries)
+        writer.finalize(
+            {
+                "tile_type": TileType.MVT,
+                "tile_compression": Compression.GZIP,
+                "min_lon_e7": int(bounds[0] * 1e7),
+                "min_lat_e7": int(bounds[1] * 1e7),
+                "max_lon_e7": int(bounds[2] * 1e7),
+                "max_lat_e7": int(bounds[3] * 1e7),
+                "center_zoom": min(layer["minzoom"] for layer in layers),
+                "center_lon_e7": int((bounds[0] + bounds[2]) / 2 * 1e7),
+                "center_lat_e7": int((bounds[1] + bounds[3]) / 2 * 1e7),
+            },
+            {
+                "name": Path(outfilename).stem,
+                "format": "pbf",
+                "vector_layers": [
+                    {"id": layer["name"], "fields": {}, "minzoom": layer["minzoom"], "maxzoom": layer["maxzoom"]}
+                    for layer in layers
+                ],
+            },
+        )
+
+    info["elapsed"] = round(time.time() - start, 3)
+    print(f"Created tileset {info['tileset']} with {info['tiles']:,} tiles in {info['elapsed']:.2f}s")
+
+    if cache_dir is not None:
+        add_tileset_to_cache(cache_dir, key, outfilename)
+
+    return info
@@ -0,0 +1,147 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow.feather import write_feather
+
+from analysis.lib.util import camelcase, get_min_uint_dtype
+
+
+# options used to encode Feather files loaded by the UI
+# dictionary: if True, categorical columns are dictionary encoded; otherwise
+#   they are converted back to the type of their categories
+# narrow_ints: if True, non-negative integer columns (and categories) are cast
+#   to the narrowest unsigned integer type that holds their values
+# compression: "uncompressed", "lz4", or "zstd" IPC buffer compression
+# sort: if True, rows are sorted by the sort_by columns passed to write_table
+PROFILES = {
+    "dictionary": {"dictionary": True, "narrow_ints": False, "compression": "uncompressed", "sort": False},
+    "dictionary_narrow": {"dictionary": True, "narrow_ints": True, "compression": "uncompressed", "sort": False},
+    "dictionary_sorted": {"dictionary": True, "narrow_ints": True, "compression": "uncompressed", "sort": True},
+    "plain": {"dictionary": False, "narrow_ints": False, "compression": "uncompressed", "sort": False},
+    "plain_narrow": {"dictionary": False, "narrow_ints": True, "compression": "uncompressed", "sort": False},
+    "dictionary_lz4": {"dictionary": True, "narrow_ints": True, "compression": "lz4", "sort": False},
+    "dictionary_zstd": {"dictionary": True, "narrow_ints": True, "compression": "zstd", "sort": False},
+}
+
+DEFAULT_PROFILE = "dictionary"
+
+
+def get_profile(profile):
+    """Get encoding options for a profile
+
+    Parameters
+    ----------
+    profile : str or dict
+        name of profile in PROFILES or dict of options
+
+    Returns
+    -------
+    dict
+    """
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            raise ValueError(f"profile must be one of {', '.join(PROFILES)}")
+        return PROFILES[profile]
+
+    return {**PROFILES[DEFAULT_PROFILE], **profile}
+
+
+def select_profile(name, results_filename):
+    """Select the profile recommended for an output by the output encoding
+    benchmark (analysis/benchmarks/output.py)
+
+    Parameters
+    ----------
+    name : str
+        name of output in benchmark results, e.g., "detectors"
+    results_filename : Path
+        benchmark results
+
+    Returns
+    -------
+    str
+        recommended profile, or DEFAULT_PROFILE if benchmark results are not
+        available
+    """
+    if results_filename.exists():
+        profile = json.loads(results_filename.read_text()).get("recommended", {}).get(name)
+        if profile in PROFILES:
+            return profile
+
+    return DEFAULT_PROFILE
+
+
+def narrow_ints(values):
+    """Cast non-negative integer values to the narrowest unsigned integer type
+
+    Parameters
+    ----------
+    values : Series or Index
+
+    Returns
+    -------
+    Series or Index
+    """
+    if not pd.api.types.is_integer_dtype(values.dtype) or len(values) == 0 or values.min() < 0:
+        return values
+
+    return values.astype(get_min_uint_dtype(values.max()))
+
+
+def encode_table(df, profile=DEFAULT_PROFILE, sort_by=None):
+    """Encode data frame as an Arrow table according to profile
+
+    Parameters
+    ----------
+    df : DataFrame
+    profile : str or dict, optional (default: "dictionary")
+        see PROFILES
+    sort_by : list, optional (default: None)
+        columns used to sort rows if profile sorts rows
+
+    Returns
+    -------
+    pyarrow.Table
+        columns are camelCased
+    """
+    options = get_profile(profile)
+    df = df.copy()
+
+    if options["sort"] and sort_by:
+        df = df.sort_values(by=sort_by, ignore_index=True)
+
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            if options["narrow_ints"]:
+                values = values.cat.rename_categories(narrow_ints(values.cat.categories))
+
+            if not options["dictionary"]:
+                dtype = values.cat.categories.dtype
+                values = values.astype(dtype if dtype != np.dtype("object") else "str")
+
+        elif options["narrow_ints"]:
+            values = narrow_ints(values)
+
+        df[col] = values
+
+    return pa.Table.from_pandas(camelcase(df), preserve_index=False).replace_schema_metadata()
+
+
+def write_table(df, filename, profile=DEFAULT_PROFILE, sort_by=None):
+    """Write data frame to a Feather file for use in the UI
+
+    Parameters
+    ----------
+    df : DataFrame
+    filename : Path
+    profile : str or dict, optional (default: "dictionary")
+        see PROFILES
+    sort_by : list, optional (default: None)
+        columns used to sort rows if profile sorts rows
+    """
+    write_feather(
+        encode_table(df, profile=profile, sort_by=sort_by), filename, compression=get_profile(profile)["compression"]
+    )
@@ -5,6 +5,7 @@ import shapely
 
 from analysis.constants import PROJ_CRS, GRTS_CENTROID_TOLERANCE, DUPLICATE_TOLERANCE
 from analysis.lib.graph import DirectedGraph
+from analysis.lib.spatial import SpatialIndex
 
 
 def extract_point_ids(df, grts):
@@ -44,7 +45,7 @@ def extract_point_ids(df, grts):
     # NOTE: some unique real-world coordinates are fuzzed to be near the center of
     # GRTS cells; do not deduplicate these against each other
     # NOTE: 10m is arbitrary but seems reasonable to capture whether or not points are at the center
-    left, right = shapely.STRtree(grts.center.to_crs(PROJ_CRS).values).query(
+    left, _ = SpatialIndex(grts.center.to_crs(PROJ_CRS).values).query_points(
         points.pt_proj.values, predicate="dwithin", distance=GRTS_CENTROID_TOLERANCE
     )
     grts_center_ids = points.point_id.take(np.unique(left))
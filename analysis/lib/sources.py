@@ -0,0 +1,160 @@
+import geopandas as gp
+import numpy as np
+import pandas as pd
+from pyarrow.feather import read_table
+
+from analysis.constants import ACTIVITY_COLUMNS
+from analysis.databasin.lib.clean import clean_batamp
+from analysis.nabat.lib.clean import clean_nabat
+
+
+def load_admin(boundary_dir):
+    """Load states / provinces
+
+    Parameters
+    ----------
+    boundary_dir : Path
+
+    Returns
+    -------
+    GeoDataFrame
+    """
+    admin_df = gp.read_feather(boundary_dir / "na_admin1.feather", columns=["geometry", "admin1_name", "country"])
+    admin_df["name"] = admin_df.admin1_name + ", " + admin_df.country.map({"CA": "Canada", "MX": "Mexico", "US": "USA"})
+
+    return admin_df
+
+
+def load_batamp(src_dir, boundary_dir):
+    """Load and clean BatAMP (Data Basin) activity and presence-only records
+
+    Parameters
+    ----------
+    src_dir : Path
+    boundary_dir : Path
+        states / provinces are loaded from here for cleaning records
+
+    Returns
+    -------
+    GeoDataFrame
+    """
+    activity_df = gp.read_feather(src_dir / "databasin/activity_datasets.feather")
+    activity_df["count_type"] = "a"  # activity
+
+    presence_df = gp.read_feather(src_dir / "databasin/presence_datasets.feather")
+    presence_df["count_type"] = "p"  # presence-only
+
+    batamp = pd.concat([activity_df, presence_df], ignore_index=True)
+    batamp = clean_batamp(batamp, load_admin(boundary_dir))
+    batamp["source"] = "batamp"
+
+    # fill missing columns specific to NABat
+    for col in ["organization"]:
+        if col not in batamp.columns:
+            batamp[col] = ""
+
+    return batamp
+
+
+def load_nabat(src_dir):
+    """Load and clean NABat stationary acoustic records
+
+    Parameters
+    ----------
+    src_dir : Path
+
+    Returns
+    -------
+    GeoDataFrame
+    """
+    # NOTE: intentionally dropping other count columns; they are not used here
+    nabat = gp.read_feather(
+        src_dir / "nabat/stationary_acoustic_counts.feather",
+        columns=[
+            "geometry",
+            "event_geometry_id",
+            "night",
+            "species_code",
+            "count_vetted",
+            "organization_name",
+            "location_name",
+            "detector",
+            "microphone",
+            "microphone_height_meters",
+            "software",
+            "project_id",
+            "project_name",
+            "grts_cell_id",
+        ],
+    ).rename(
+        columns={
+            "location_name": "site_name",
+            "detector": "det_type",
+            "microphone": "mic_type",
+            "microphone_height_meters": "mic_ht",
+            "software": "call_id",
+            "project_id": "dataset",
+            "project_name": "dataset_name",
+            "organization_name": "organization",
+        }
+    )
+    # mark project leaders as the contributors for the project
+    nabat_contributors = (
+        pd.read_feather(src_dir / "nabat/projects.feather", columns=["id", "leaders"])
+        .set_index("id")
+        .leaders.rename("contributors")
+    )
+    nabat = nabat.join(nabat_contributors, on="dataset")
+
+    nabat = clean_nabat(nabat).drop(columns=["event_geometry_id"])
+    nabat["count_type"] = "a"  # all are activity measures (in theory)
+    nabat["source"] = "nabat"
+    nabat["dataset"] = nabat.dataset.astype(str)
+
+    for col in ACTIVITY_COLUMNS:
+        if col not in nabat.columns:
+            nabat[col] = np.nan
+        nabat[col] = nabat[col].astype("Int32")
+
+    # fill missing columns specific to BatAMP
+    for col in ["wthr_prof", "refl_type"]:
+        nabat[col] = ""
+
+    return nabat
+
+
+def load_to_arrow(loader, filename, *args):
+    """Call loader in a worker process and write its result to an uncompressed
+    Arrow IPC (Feather) file so that it can be memory-mapped by the calling
+    process, instead of pickling the result back to it.
+
+    Parameters
+    ----------
+    loader : function
+        returns a GeoDataFrame; must be importable by the worker process
+    filename : Path
+    *args
+        passed to loader
+
+    Returns
+    -------
+    Path
+        filename
+    """
+    loader(*args).to_feather(filename, compression="uncompressed")
+    return filename
+
+
+def read_arrow(filename):
+    """Read a GeoDataFrame written by load_to_arrow, memory-mapping the file
+    instead of reading it into memory before it is converted.
+
+    Parameters
+    ----------
+    filename : Path
+
+    Returns
+    -------
+    GeoDataFrame
+    """
+    return gp.GeoDataFrame.from_arrow(read_table(filename, memory_map=True))
@@ -0,0 +1,100 @@
+import numpy as np
+import shapely
+
+
+# predicate(boundary, point) that is equivalent to predicate(point, boundary)
+CONVERSE_PREDICATES = {
+    "intersects": "intersects",
+    "dwithin": "dwithin",
+    "within": "contains",
+    "contains": "within",
+    "covered_by": "covers",
+    "covers": "covered_by",
+    "touches": "touches",
+}
+
+
+class SpatialIndex(object):
+    def __init__(self, geometries):
+        """Create a reusable index for finding points that satisfy a predicate
+        with boundary geometries.
+
+        Geometries are prepared once so that predicate tests against them are
+        fast, including when the index is queried multiple times with
+        different sets of points.
+
+        Parameters
+        ----------
+        geometries : ndarray of shapely geometries
+        """
+        self.geometries = np.asarray(geometries)
+        shapely.prepare(self.geometries)
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def query_points(self, points, predicate="intersects", distance=None):
+        """Find all pairs of points and boundary geometries that satisfy predicate.
+
+        Points are deduplicated by coordinate and a tree is built over the
+        unique points, which is then queried using the prepared boundary
+        geometries. Results are broadcast back to all input points that share
+        those coordinates.
+
+        NOTE: shapely only uses prepared geometries for the geometries used to
+        query a tree, not those within the tree, so the tree must be built over
+        the points rather than the boundaries.
+
+        Parameters
+        ----------
+        points : ndarray of shapely Point geometries
+        predicate : str, optional (default: "intersects")
+            predicate evaluated as predicate(point, boundary); must be one of
+            CONVERSE_PREDICATES
+        distance : float, optional (default: None)
+            required if predicate is "dwithin"
+
+        Returns
+        -------
+        tuple of (ndarray, ndarray)
+            indexes into points and indexes into geometries of this index,
+            sorted by point index then geometry index
+        """
+        if predicate not in CONVERSE_PREDICATES:
+            raise ValueError(f"predicate must be one of {', '.join(CONVERSE_PREDICATES)}")
+
+        points = np.asarray(points)
+        coords = np.stack([shapely.get_x(points), shapely.get_y(points)], axis=1)
+        unique_coords, inverse = np.unique(coords, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+
+        tree = shapely.STRtree(shapely.points(unique_coords))
+        right, left = tree.query(self.geometries, predicate=CONVERSE_PREDICATES[predicate], distance=distance)
+
+        # broadcast results for each unique coordinate back to every point with
+        # that coordinate (sorted by unique coordinate index)
+        order = np.argsort(inverse, kind="stable")
+        counts = np.bincount(inverse, minlength=len(unique_coords))
+        starts = np.cumsum(counts) - counts
+        repeats = counts[left]
+        offsets = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        point_ix = order[np.repeat(starts[left], repeats) + offsets]
+        geom_ix = np.repeat(right, repeats)
+
+        sort_ix = np.lexsort([geom_ix, point_ix])
+        return point_ix.take(sort_ix), geom_ix.take(sort_ix)
+
+    def intersects_points(self, points):
+        """Return boolean mask of points that intersect any boundary geometry.
+
+        Parameters
+        ----------
+        points : ndarray of shapely Point geometries
+
+        Returns
+        -------
+        ndarray of bool
+        """
+        mask = np.zeros(len(points), dtype="bool")
+        mask[self.query_points(points)[0]] = True
+        return mask
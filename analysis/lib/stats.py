@@ -0,0 +1,285 @@
+from pathlib import Path
+
+import pandas as pd
+
+
+# records are accumulated separately for each partition so that partitions can
+# be recalculated or added without rescanning all records
+PARTITION_COLS = ["source", "year"]
+
+# statistics are accumulated at this grain within each partition; distinct
+# counts of contributors and detectors are calculated exactly from the keys
+# NOTE: records are keyed by the integer ID of their set of contributors, which
+# is linked to individual contributors when calculating statistics
+KEY_COLS = PARTITION_COLS + ["count_type", "contributor_set", "det_id"]
+
+# counts and sums; these are merged by addition
+RECORD_COLS = ["detector_nights", "detection_nights"]
+SPECIES_COLS = ["detections", "detector_nights", "detection_nights"]
+
+
+class StatsAccumulator(object):
+    def __init__(self, records, species):
+        """Mergeable statistics of detector nights, used to calculate summary,
+        contributor, and species statistics.
+
+        Use StatsAccumulator.from_records() to create from merged records.
+
+        Parameters
+        ----------
+        records : DataFrame
+            KEY_COLS and RECORD_COLS: number of detector nights and nights with
+            detections of any species
+        species : DataFrame
+            KEY_COLS, "species", and SPECIES_COLS: total detections, number of
+            nights the species was surveyed, and number of nights it was
+            detected; only includes species that were surveyed
+        """
+        self.records = records
+        self.species = species
+
+    @classmethod
+    def from_records(cls, df, activity_columns):
+        """Accumulate statistics from records in a single grouped pass.
+
+        Parameters
+        ----------
+        df : DataFrame
+            one record per detector night; must include KEY_COLS,
+            "spp_detections", and activity_columns, where activity columns are
+            null if the species was not surveyed
+        activity_columns : list-like
+
+        Returns
+        -------
+        StatsAccumulator
+        """
+        activity = df[activity_columns]
+        keys = [df[col] for col in KEY_COLS]
+
+        grouped = pd.concat(
+            [
+                activity,
+                activity.notnull().add_suffix(":detector_nights"),
+                (activity > 0).add_suffix(":detection_nights"),
+                (df.spp_detections > 0).rename("detection_nights"),
+            ],
+            axis=1,
+        ).groupby(keys, dropna=False, sort=False)
+
+        totals = grouped.sum()
+        records = totals[["detection_nights"]].assign(detector_nights=grouped.size())[RECORD_COLS]
+
+        # pivot species to rows and keep only those surveyed within each group
+        species = pd.concat(
+            {
+                "detections": totals[activity_columns],
+                "detector_nights": totals[[f"{c}:detector_nights" for c in activity_columns]].set_axis(
+                    activity_columns, axis=1
+                ),
+                "detection_nights": totals[[f"{c}:detection_nights" for c in activity_columns]].set_axis(
+                    activity_columns, axis=1
+                ),
+            },
+            axis=1,
+        ).stack(future_stack=True)
+        species.index = species.index.set_names("species", level=-1)
+        species = species.loc[species.detector_nights > 0]
+
+        return cls(records.reset_index(), species.reset_index())
+
+    @classmethod
+    def read(cls, path):
+        """Read accumulated statistics written by write()
+
+        Parameters
+        ----------
+        path : Path
+            directory
+
+        Returns
+        -------
+        StatsAccumulator
+        """
+        path = Path(path)
+        return cls(pd.read_feather(path / "records.feather"), pd.read_feather(path / "species.feather"))
+
+    def write(self, path):
+        """Write accumulated statistics to records.feather and species.feather
+        in path, so that they can be merged with statistics of new records later
+
+        Parameters
+        ----------
+        path : Path
+            directory; created if it does not exist
+        """
+        path = Path(path)
+        path.mkdir(exist_ok=True, parents=True)
+        self.records.to_feather(path / "records.feather")
+        self.species.to_feather(path / "species.feather")
+
+    @property
+    def partitions(self):
+        """Unique partitions in accumulated statistics
+
+        Returns
+        -------
+        DataFrame
+            PARTITION_COLS
+        """
+        return self.records[PARTITION_COLS].drop_duplicates().reset_index(drop=True)
+
+    def merge(self, other):
+        """Merge statistics of records that are not in this accumulator.
+
+        Counts and sums are added, and groups of distinct contributors and
+        detectors are combined.
+
+        Parameters
+        ----------
+        other : StatsAccumulator
+
+        Returns
+        -------
+        StatsAccumulator
+        """
+        return StatsAccumulator(
+            pd.concat([self.records, other.records], ignore_index=True)
+            .groupby(KEY_COLS, dropna=False, sort=False)[RECORD_COLS]
+            .sum()
+            .reset_index(),
+            pd.concat([self.species, other.species], ignore_index=True)
+            .groupby(KEY_COLS + ["species"], dropna=False, sort=False)[SPECIES_COLS]
+            .sum()
+            .reset_index(),
+        )
+
+    def update(self, other):
+        """Replace partitions of this accumulator with those in other, e.g.,
+        when records for a source and year are recalculated, and add any new
+        partitions.
+
+        Parameters
+        ----------
+        other : StatsAccumulator
+
+        Returns
+        -------
+        StatsAccumulator
+        """
+        index = pd.MultiIndex.from_frame(other.partitions)
+        return StatsAccumulator(
+            self.records.loc[~pd.MultiIndex.from_frame(self.records[PARTITION_COLS]).isin(index)],
+            self.species.loc[~pd.MultiIndex.from_frame(self.species[PARTITION_COLS]).isin(index)],
+        ).merge(other)
+
+    def get_contributor_stats(self, contributor_sets):
+        """Calculate statistics for each individual contributor
+
+        Parameters
+        ----------
+        contributor_sets : DataFrame
+            "contributor_set" and "contributor": ID of each contributor in each
+            set of contributors
+
+        Returns
+        -------
+        DataFrame
+            contributor, speciesDetections, detector_nights, detectors,
+            speciesDetected
+        """
+        records = self.records.merge(contributor_sets, on="contributor_set")
+        species = self.species.merge(contributor_sets, on="contributor_set")
+        grouped = records.groupby("contributor")
+
+        return (
+            pd.DataFrame(species.groupby("contributor").detections.sum().rename("speciesDetections"))
+            .join(grouped.detector_nights.sum(), how="right")
+            .join(grouped.det_id.nunique().rename("detectors"))
+            # only count species where there was > 0 activity detected
+            .join(
+                species.loc[species.detections > 0].groupby("contributor").species.nunique().rename("speciesDetected")
+            )
+            .fillna(0)
+            .astype("uint")
+            .reset_index()
+        )
+
+    def get_species_stats(self, species, contributor_sets):
+        """Calculate statistics for each species
+
+        Parameters
+        ----------
+        species : list-like
+            all species to include, even if they have not been surveyed
+        contributor_sets : DataFrame
+            "contributor_set" and "contributor": ID of each contributor in each
+            set of contributors
+
+        Returns
+        -------
+        DataFrame
+            species, detections, presence_only_detections, detector_nights,
+            presence_only_detector_nights, detection_nights, contributors,
+            detectors, presecence_only_detectors
+        """
+        grouped = self.species.groupby("species")
+        presence = self.species.loc[self.species.count_type == "p"].groupby("species")
+        contributors = (
+            self.species[["species", "contributor_set"]]
+            .drop_duplicates()
+            .merge(contributor_sets, on="contributor_set")
+            .groupby("species")
+            .contributor.nunique()
+            .rename("contributors")
+        )
+
+        spp_stats = (
+            grouped[["detections"]]
+            .sum()
+            .join(presence.detections.sum().rename("presence_only_detections"))
+            .join(grouped.detector_nights.sum())
+            .join(presence.detector_nights.sum().rename("presence_only_detector_nights"))
+            .join(grouped.detection_nights.sum())
+            .join(contributors)
+            .join(grouped.det_id.nunique().rename("detectors"))
+            .join(presence.det_id.nunique().rename("presecence_only_detectors"))
+        )
+
+        # add any missing species we want listed but haven't yet been monitored
+        index = list(spp_stats.index) + [spp for spp in species if spp not in spp_stats.index]
+
+        return (
+            spp_stats.reindex(index)
+            .fillna(0)
+            .astype("uint")
+            .reset_index()
+            .rename(columns={"index": "species"})
+            .sort_values("species")
+        )
+
+    def get_summary(self):
+        """Calculate high-level summary statistics
+
+        Returns
+        -------
+        dict
+        """
+        records = self.records
+        activity = records.count_type == "a"
+        presence = records.count_type == "p"
+
+        return {
+            "speciesDetected": self.species.loc[self.species.detections > 0].species.nunique(),
+            "detectors": records.det_id.nunique(),
+            "activityDetectors": records.loc[activity].det_id.nunique(),
+            "presenceDetectors": records.loc[presence].det_id.nunique(),
+            "speciesDetections": self.species.detections.sum().item(),
+            # detector_nights are sampling activity
+            "detectorNights": records.detector_nights.sum().item(),
+            "activityDetectorNights": records.loc[activity].detector_nights.sum().item(),
+            "presenceDetectorNights": records.loc[presence].detector_nights.sum().item(),
+            # detection_nights are nights where at least one species was detected
+            "detectionNights": records.detection_nights.sum().item(),
+            "years": sorted(x.item() for x in records.year.unique()),
+        }
@@ -1,10 +1,12 @@
+import hashlib
 from pathlib import Path
+import shutil
 import subprocess
+import tempfile
+import time
 
-from pyogrio import write_dataframe
-
-
-tmp_dir = Path("/tmp")
+import pandas as pd
+import shapely
 
 
 def get_col_types(df, bool_cols=None):
@@ -43,7 +45,159 @@ def get_col_types(df, bool_cols=None):
     return out
 
 
-def create_tileset(df, outfilename, layer, minzoom=0, maxzoom=12, args=None):
+def hash_features(df):
+    """Calculate a hash of the attributes and geometries of features
+
+    Parameters
+    ----------
+    df : GeoDataFrame
+
+    Returns
+    -------
+    bytes
+    """
+    geometry = df.geometry.values
+    attributes = pd.DataFrame(df.drop(columns=[df.geometry.name]))
+
+    h = hashlib.sha256()
+    h.update(",".join(attributes.columns).encode("utf8"))
+    h.update(pd.util.hash_pandas_object(attributes, index=False).values.tobytes())
+    # NOTE: WKB is self-delimiting, so geometries can be hashed together
+    h.update(b"".join(shapely.to_wkb(geometry)))
+
+    return h.digest()
+
+
+def get_cached_tileset(cache_dir, key, outfilename):
+    """Copy tileset from cache to outfilename if it exists in the cache
+
+    Parameters
+    ----------
+    cache_dir : Path
+    key : str
+        cache key
+    outfilename : Path or str
+
+    Returns
+    -------
+    bool
+        True if tileset was found in cache
+    """
+    cached_filename = cache_dir / f"{key}{Path(outfilename).suffix}"
+    if not cached_filename.exists():
+        return False
+
+    shutil.copyfile(cached_filename, outfilename)
+    return True
+
+
+def add_tileset_to_cache(cache_dir, key, filename):
+    """Copy tileset into cache
+
+    Parameters
+    ----------
+    cache_dir : Path
+    key : str
+        cache key
+    filename : Path or str
+    """
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    cached_filename = cache_dir / f"{key}{Path(filename).suffix}"
+
+    # copy to unique temporary file first so that an interrupted or concurrent
+    # copy is never used
+    with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as tmp:
+        tmp_filename = Path(tmp.name)
+
+    shutil.copyfile(filename, tmp_filename)
+    tmp_filename.replace(cached_filename)
+
+
+def to_geojson_seq(df, chunk_size=10000):
+    """Encode features as newline-delimited GeoJSON in chunks, so that only one
+    chunk of encoded features is held in memory at a time
+
+    Parameters
+    ----------
+    df : GeoDataFrame
+    chunk_size : int, optional (default: 10000)
+        number of features encoded in each chunk
+
+    Yields
+    ------
+    bytes
+        encoded features of each chunk
+    """
+    for i in range(0, len(df), chunk_size):
+        chunk = df.iloc[i : i + chunk_size]
+        properties = (
+            pd.DataFrame(chunk.drop(columns=[chunk.geometry.name])).to_json(orient="records", lines=True).splitlines()
+        )
+        geometries = shapely.to_geojson(chunk.geometry.values)
+
+        yield "".join(
+            f'{{"type":"Feature","properties":{props},"geometry":{geom}}}\n'
+            for props, geom in zip(properties, geometries)
+        ).encode("utf8")
+
+
+def run_tool(cmd, input=None):
+    """Run tippecanoe or tile-join, capturing its output
+
+    Parameters
+    ----------
+    cmd : list
+        command-line arguments
+    input : iterable of bytes, optional (default: None)
+        chunks of data written to stdin as they are produced
+
+    Returns
+    -------
+    dict
+        {"elapsed": <seconds>, "stderr": <output written to stderr>}
+    """
+    start = time.time()
+
+    # stderr is written to a temporary file instead of a pipe so that the tool
+    # cannot block on a full stderr pipe while stdin is being written
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr_file,
+            # chunks are large, so write them directly without buffering
+            bufsize=0,
+        )
+
+        try:
+            if input is not None:
+                try:
+                    for chunk in input:
+                        proc.stdin.write(chunk)
+                except BrokenPipeError:
+                    # tool exited early; its error is reported from stderr below
+                    pass
+                finally:
+                    proc.stdin.close()
+
+            returncode = proc.wait()
+
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode("utf8", errors="replace")
+
+    if returncode != 0:
+        raise RuntimeError(f"{cmd[0]} failed with exit code {returncode}:\n{stderr}")
+
+    return {"elapsed": round(time.time() - start, 3), "stderr": stderr}
+
+
+def create_tileset(df, outfilename, layer, minzoom=0, maxzoom=12, args=None, cache_dir=None):
     """Create tileset from data frame
 
     Parameters
@@ -57,39 +211,65 @@ def create_tileset(df, outfilename, layer, minzoom=0, maxzoom=12, args=None):
     maxzoom : int, optional: (default: 12)
     args : list, optional
         list of additional command-line arguments to tippecanoe
+    cache_dir : Path, optional (default: None)
+        if present, tilesets are cached in this directory by a hash of the
+        features, layer, zoom levels, and tippecanoe arguments and are only
+        created again if any of those change
+
+    Returns
+    -------
+    dict
+        {"tileset": <name>, "cached": <bool>, "elapsed": <seconds>, "stderr": <tippecanoe output>}
     """
-    tmp_filename = tmp_dir / "data.fgb"
-    write_dataframe(df, tmp_filename)
+    info = {"tileset": Path(outfilename).name, "cached": False, "elapsed": 0, "stderr": ""}
 
-    args = [] if args is None else args
+    args = [] if args is None else list(args)
     if "id" in df.columns:
         args.append("--use-attribute-for-id=id")
 
-    ret = subprocess.run(
-        [
-            "tippecanoe",
-            "-f",
-            "--no-tile-stats",
-            "--preserve-input-order",
-            "--no-tile-size-limit",
-            "--no-feature-limit",
-            "--hilbert",
-            f"-Z{minzoom}",
-            f"-z{maxzoom}",
-            "-l",
-            layer,
-            "-o",
-            f"{outfilename}",
-        ]
-        + args
-        + get_col_types(df)
-        + [str(tmp_filename)],
+    args = args + get_col_types(df)
+
+    if cache_dir is not None:
+        h = hashlib.sha256(hash_features(df))
+        h.update("\0".join([layer, str(minzoom), str(maxzoom)] + args).encode("utf8"))
+        key = h.hexdigest()
+
+        if get_cached_tileset(cache_dir, key, outfilename):
+            print(f"Using cached tileset for {layer}")
+            info["cached"] = True
+            return info
+
+    # features are encoded and streamed to tippecanoe on stdin in chunks
+    info.update(
+        run_tool(
+            [
+                "tippecanoe",
+                "-f",
+                "--no-tile-stats",
+                "--preserve-input-order",
+                "--no-tile-size-limit",
+                "--no-feature-limit",
+                "--hilbert",
+                f"-Z{minzoom}",
+                f"-z{maxzoom}",
+                "-l",
+                layer,
+                "-o",
+                f"{outfilename}",
+            ]
+            + args,
+            input=to_geojson_seq(df),
+        )
     )
-    ret.check_returncode()
-    tmp_filename.unlink()
+    print(f"Created tileset for {layer} in {info['elapsed']:.2f}s")
+
+    if cache_dir is not None:
+        add_tileset_to_cache(cache_dir, key, outfilename)
+
+    return info
 
 
-def join_tilesets(tilesets, outfilename):
+def join_tilesets(tilesets, outfilename, cache_dir=None):
     """Join tilesets into a single tileset
 
     Parameters
@@ -98,8 +278,37 @@ def join_tilesets(tilesets, outfilename):
         list of input tileset paths
     outfilename : Path or str
         name of output tileset, can be *.mbtiles or *.pmtiles
+    cache_dir : Path, optional (default: None)
+        if present, joined tilesets are cached in this directory by a hash of
+        the contents of the input tilesets and are only joined again if any of
+        those change
+
+    Returns
+    -------
+    dict
+        {"tileset": <name>, "cached": <bool>, "elapsed": <seconds>, "stderr": <tile-join output>}
     """
-    ret = subprocess.run(
-        ["tile-join", "-f", "-pg", "--no-tile-size-limit", "-o", str(outfilename)] + [str(f) for f in tilesets]
-    )
-    ret.check_returncode()
+    info = {"tileset": Path(outfilename).name, "cached": False, "elapsed": 0, "stderr": ""}
+
+    args = ["-f", "-pg", "--no-tile-size-limit"]
+
+    if cache_dir is not None:
+        h = hashlib.sha256("\0".join(args).encode("utf8"))
+        for filename in tilesets:
+            with open(filename, "rb") as f:
+                h.update(hashlib.file_digest(f, "sha256").digest())
+
+        key = h.hexdigest()
+
+        if get_cached_tileset(cache_dir, key, outfilename):
+            print(f"Using cached joined tileset for {info['tileset']}")
+            info["cached"] = True
+            return info
+
+    info.update(run_tool(["tile-join"] + args + ["-o", str(outfilename)] + [str(f) for f in tilesets]))
+    print(f"Joined tileset {info['tileset']} in {info['elapsed']:.2f}s")
+
+    if cache_dir is not None:
+        add_tileset_to_cache(cache_dir, key, outfilename)
+
+    return info
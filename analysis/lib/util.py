@@ -1,5 +1,8 @@
 import re
 
+import numpy as np
+import pandas as pd
+
 
 def to_nested_json(filename, df, field_name):
     with open(filename, "w") as out:
@@ -47,3 +50,73 @@ def get_min_uint_dtype(max_value):
     if max_value < 4294967295:
         return "uint32"
     return "uint"
+
+
+def explode_unique(groups, values, sep=","):
+    """Split delimited values and find the unique individual values within each
+    group.
+
+    Empty and null values are dropped.
+
+    Parameters
+    ----------
+    groups : Series
+        group of each value
+    values : Series
+        string values, aligned to groups
+    sep : str, optional (default: ",")
+        delimiter used to split values
+
+    Returns
+    -------
+    DataFrame
+        "group" and "value"; values of each group are contiguous and sorted
+    """
+    # split each unique value only once; null values have code -1 and are
+    # dropped by the join below
+    codes, uniques = pd.factorize(values)
+    parts = pd.Series(uniques).str.split(sep).explode()
+    parts = parts.loc[parts.notnull() & (parts != "")]
+
+    # categories are sorted so that values within each group are sorted by
+    # their codes
+    categories = np.array(sorted(parts.unique()), dtype="object")
+    parts = pd.Series(pd.Categorical(parts.values, categories=categories).codes, index=parts.index, name="part")
+
+    group_codes, group_uniques = pd.factorize(groups)
+    df = (
+        pd.DataFrame({"group": group_codes, "code": codes})
+        .drop_duplicates()
+        .join(parts, on="code", how="inner")
+        .drop_duplicates(["group", "part"])
+        .sort_values(["group", "part"])
+    )
+
+    return pd.DataFrame({"group": group_uniques.take(df.group.values), "value": categories.take(df.part.values)})
+
+
+def join_unique(groups, values, sep=","):
+    """Join the sorted unique values within each group into a delimited string.
+
+    Values may already be delimited lists; these are split into individual
+    values first. Empty and null values are dropped.
+
+    Parameters
+    ----------
+    groups : Series
+        group of each value
+    values : Series
+        string values, aligned to groups
+    sep : str, optional (default: ",")
+        delimiter used to split and join values
+
+    Returns
+    -------
+    Series
+        delimited string indexed by group; groups without any values are
+        omitted
+    """
+    df = explode_unique(groups, values, sep=sep)
+    group_codes, group_uniques = pd.factorize(df.group)
+    joined = df.value.groupby(group_codes, sort=False).agg(sep.join)
+    return pd.Series(joined.values, index=group_uniques.take(joined.index.values))
@@ -1,22 +1,28 @@
+from concurrent.futures import ProcessPoolExecutor
 import json
+import multiprocessing
 from pathlib import Path
+from tempfile import TemporaryDirectory
 import warnings
 
-from h3ronpy.vector import coordinates_to_cells, cells_to_wkb_polygons
 import pandas as pd
-import pyarrow as pa
-from pyarrow.feather import write_feather
 import geopandas as gp
 import numpy as np
 import shapely
 
 from analysis.constants import ACTIVITY_COLUMNS, NABAT_TOLERANCE, SPECIES_ID
+from analysis.lib.dimensions import create_dimension, to_link_arrays
 from analysis.lib.height import fix_mic_height
+from analysis.lib.ids import allocate_ids
+from analysis.lib.hexes import assign_cells, get_cell_polygons, write_hexes
 from analysis.lib.points import extract_point_ids
-from analysis.lib.tiles import create_tileset, join_tilesets
-from analysis.lib.util import camelcase, get_min_uint_dtype
-from analysis.databasin.lib.clean import clean_batamp
-from analysis.nabat.lib.clean import clean_nabat
+from analysis.lib.sources import load_admin, load_batamp, load_nabat, load_to_arrow, read_arrow
+from analysis.lib.spatial import SpatialIndex
+from analysis.lib.stats import StatsAccumulator
+from analysis.lib.mvt import create_polygon_tileset
+from analysis.lib.output import select_profile, write_table
+from analysis.lib.tiles import create_tileset
+from analysis.lib.util import camelcase, get_min_uint_dtype, join_unique
 
 
 data_dir = Path("data")
@@ -31,97 +37,42 @@ static_data_dir = Path("ui/static/data")
 static_data_dir.mkdir(exist_ok=True)
 static_spp_data_dir = static_data_dir / "species"
 static_spp_data_dir.mkdir(exist_ok=True)
-tmp_dir = Path("/tmp")
+# IDs of sites, detectors, and hexes are stored here so that they are stable
+# between runs
+id_dir = derived_dir / "ids"
+# tilesets are cached here and only recreated when their features change
+tile_cache_dir = derived_dir / "tile_cache"
+# encoding of Feather files loaded by the UI (see analysis/lib/output.py); if
+# None, the profile recommended by analysis/benchmarks/output.py is used if
+# available
+OUTPUT_PROFILE = None
+benchmark_results_filename = data_dir / "benchmarks/output.json"
 
 
 ################################################################################
-### Calculate center of each GRTS cell and use these to mark coordinates likely assigned there
+### Read BatAMP (Data Basin) and NABat data
 ################################################################################
-grts = gp.read_feather(boundary_dir / "na_grts.feather", columns=["geometry"])
-grts["center"] = gp.GeoSeries(shapely.centroid(grts.geometry.values), crs=grts.crs)
+# BatAMP and NABat are loaded and cleaned in separate processes, which write
+# them to Arrow files that are memory-mapped here; boundaries are loaded here
+# in the meantime
+with (
+    TemporaryDirectory() as tmp_dir,
+    # use fork so that workers do not import this script again
+    ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("fork")) as executor,
+):
+    tmp_dir = Path(tmp_dir)
+    batamp_future = executor.submit(load_to_arrow, load_batamp, tmp_dir / "batamp.feather", src_dir, boundary_dir)
+    nabat_future = executor.submit(load_to_arrow, load_nabat, tmp_dir / "nabat.feather", src_dir)
 
+    ### Calculate center of each GRTS cell and use these to mark coordinates likely assigned there
+    grts = gp.read_feather(boundary_dir / "na_grts.feather", columns=["geometry"])
+    grts["center"] = gp.GeoSeries(shapely.centroid(grts.geometry.values), crs=grts.crs)
 
-################################################################################
-### Load states / provinces
-################################################################################
-admin_df = gp.read_feather(boundary_dir / "na_admin1.feather", columns=["geometry", "admin1_name", "country"])
-admin_df["name"] = admin_df.admin1_name + ", " + admin_df.country.map({"CA": "Canada", "MX": "Mexico", "US": "USA"})
-
-################################################################################
-### Read BatAMP (Data Basin) data
-################################################################################
-
-activity_df = gp.read_feather(src_dir / "databasin/activity_datasets.feather")
-activity_df["count_type"] = "a"  # activity
+    ### Load states / provinces
+    admin_df = load_admin(boundary_dir)
 
-presence_df = gp.read_feather(src_dir / "databasin/presence_datasets.feather")
-presence_df["count_type"] = "p"  # presence-only
-
-batamp = pd.concat([activity_df, presence_df], ignore_index=True)
-batamp = clean_batamp(batamp, admin_df)
-batamp["source"] = "batamp"
-
-# fill missing columns specific to NABat
-for col in ["organization"]:
-    if col not in batamp.columns:
-        batamp[col] = ""
-
-
-################################################################################
-### Read NABat data
-################################################################################
-# NOTE: intentionally dropping other count columns; they are not used here
-nabat = gp.read_feather(
-    src_dir / "nabat/stationary_acoustic_counts.feather",
-    columns=[
-        "geometry",
-        "event_geometry_id",
-        "night",
-        "species_code",
-        "count_vetted",
-        "organization_name",
-        "location_name",
-        "detector",
-        "microphone",
-        "microphone_height_meters",
-        "software",
-        "project_id",
-        "project_name",
-        "grts_cell_id",
-    ],
-).rename(
-    columns={
-        "location_name": "site_name",
-        "detector": "det_type",
-        "microphone": "mic_type",
-        "microphone_height_meters": "mic_ht",
-        "software": "call_id",
-        "project_id": "dataset",
-        "project_name": "dataset_name",
-        "organization_name": "organization",
-    }
-)
-# mark project leaders as the contributors for the project
-nabat_contributors = (
-    pd.read_feather(src_dir / "nabat/projects.feather", columns=["id", "leaders"])
-    .set_index("id")
-    .leaders.rename("contributors")
-)
-nabat = nabat.join(nabat_contributors, on="dataset")
-
-nabat = clean_nabat(nabat).drop(columns=["event_geometry_id"])
-nabat["count_type"] = "a"  # all are activity measures (in theory)
-nabat["source"] = "nabat"
-nabat["dataset"] = nabat.dataset.astype(str)
-
-for col in ACTIVITY_COLUMNS:
-    if col not in nabat.columns:
-        nabat[col] = np.nan
-    nabat[col] = nabat[col].astype("Int32")
-
-# fill missing columns specific to BatAMP
-for col in ["wthr_prof", "refl_type"]:
-    nabat[col] = ""
+    batamp = read_arrow(batamp_future.result())
+    nabat = read_arrow(nabat_future.result())
 
 
 ################################################################################
@@ -488,25 +439,35 @@ for col in activity_columns:
 print("Adding country / state to sites")
 
 sites = gp.GeoDataFrame(
-    df.groupby("point_id")[["geometry"]].first().reset_index().reset_index().rename(columns={"index": "id"}),
+    df.groupby("point_id")[["geometry"]].first().reset_index(),
     geometry="geometry",
     crs=df.crs,
 )
-# use int32 so that it works for point ID in tiles
-sites["id"] = (sites.id.values + 1).astype("int32")
+# limit to int32 so that it works for point ID in tiles
+sites.insert(0, "id", allocate_ids(sites.point_id, id_dir / "sites.feather", max_dtype="int32"))
 site_id = sites.set_index("point_id").id
 df["site_id"] = df.point_id.map(site_id)
 
 # create site tiles
+# NOTE: timing and output of each tileset build are saved to tile_builds.json
+tile_builds = []
 # TODO: tune max zoom
-create_tileset(
-    sites[["id", "geometry"]], tile_dir / "sites.pmtiles", layer="sites", minzoom=0, maxzoom=12, args=["-B0"]
+tile_builds.append(
+    create_tileset(
+        sites[["id", "geometry"]],
+        tile_dir / "sites.pmtiles",
+        layer="sites",
+        minzoom=0,
+        maxzoom=12,
+        args=["-B0"],
+        cache_dir=tile_cache_dir,
+    )
 )
 
 ### join admin level 1 to sites
 # NOTE: missing admin areas are most likely offshore
-left, right = shapely.STRtree(sites.geometry.values).query(admin_df.geometry.values, predicate="intersects")
-site_admin = pd.Series(admin_df.name.values.take(left), index=sites.index.values.take(right), name="admin1_name")
+left, right = SpatialIndex(admin_df.geometry.values).query_points(sites.geometry.values)
+site_admin = pd.Series(admin_df.name.values.take(right), index=sites.index.values.take(left), name="admin1_name")
 sites = sites.join(site_admin)
 sites["admin1_name"] = sites.admin1_name.fillna("Offshore").astype("category")
 
@@ -525,106 +486,92 @@ hex_levels = [
 H3_COLS = [f"h3l{entry['level']}" for entry in hex_levels]
 sites["lon"] = sites.geometry.x
 sites["lat"] = sites.geometry.y
-tilesets = []
-for entry, col in zip(hex_levels, H3_COLS):
-    level = entry["level"]
-    print(f"Assigning to H3 level {level} and creating tiles")
-    hex_id = coordinates_to_cells(sites.lat.values, sites.lon.values, level)
-    ids, index_values = np.unique(hex_id, return_inverse=True)
-    # use smaller index values to avoid BigInt issues in UI (can currently fit all values into uint16)
-    index_values = (index_values + 1).astype("uint16")
-    sites[col] = pd.Series(index_values, dtype="category")
+levels = [entry["level"] for entry in hex_levels]
+print("Assigning to H3 levels")
+hex_cells = assign_cells(sites.lat.values, sites.lon.values, levels)
+# create polygons for all levels at once; these are cached by cell across runs
+hex_polygons = get_cell_polygons(
+    np.concatenate([hex_cells[level][0] for level in levels]), derived_dir / "h3_polygons.feather"
+)
+hex_polygons = np.split(hex_polygons, np.cumsum([len(hex_cells[level][0]) for level in levels])[:-1])
+
+hex_layers = []
+for entry, col, polygons in zip(hex_levels, H3_COLS, hex_polygons):
+    cells, index_values = hex_cells[entry["level"]]
+    ids = allocate_ids(cells, id_dir / f"{col}.feather")
+    sites[col] = pd.Series(ids[index_values], dtype="category")
 
     hexes = gp.GeoDataFrame(
-        {"id": np.arange(1, len(ids) + 1, dtype="uint16")},
-        geometry=shapely.from_wkb(cells_to_wkb_polygons(ids)),
+        {"id": ids, "cell": cells},
+        geometry=shapely.from_wkb(polygons),
         crs="EPSG:4326",
     )
-    hexes.to_feather(derived_dir / f"{col}.feather")
+    # only written if cells or IDs changed since the last run
+    write_hexes(hexes, derived_dir / f"{col}.feather")
 
-    outfilename = tmp_dir / f"{col}.pmtiles"
-    tilesets.append(outfilename)
-    create_tileset(hexes, outfilename, layer=col, minzoom=entry["minzoom"], maxzoom=entry["maxzoom"])
+    hex_layers.append(
+        {"name": col, "df": hexes[["id", "geometry"]], "minzoom": entry["minzoom"], "maxzoom": entry["maxzoom"]}
+    )
+
+# hexagons are simple polygons with only an ID, so all levels are written
+# directly to a single multi-layer tileset instead of using tippecanoe
+print("Creating H3 tiles")
+tile_builds.append(create_polygon_tileset(hex_layers, tile_dir / "h3.pmtiles", cache_dir=tile_cache_dir))
 
-# create joined tiles and remove intermediates
-join_tilesets(tilesets, tile_dir / "h3.pmtiles")
-for tileset in tilesets:
-    tileset.unlink()
+(derived_dir / "tile_builds.json").write_text(json.dumps(tile_builds, indent=2))
 
 
 ################################################################################
 ### Extract detector-level info
 ################################################################################
+first_cols = ["source", "site_id", "mic_ht", "det_type", "mic_type", "refl_type", "wthr_prof", "call_id", "count_type"]
+
 detectors = (
-    df[
-        [
-            "source",
-            "det_id",
-            "site_id",
-            "mic_ht",
-            "det_type",
-            "mic_type",
-            "refl_type",
-            "wthr_prof",
-            "call_id",
-            "dataset",
-            "organization",
-            "contributors",
-            "site_name",
-            "count_type",
-            "night",
-            "spp_detections",
-        ]
-    ]
+    df[["det_id", "night", "spp_detections"] + first_cols]
     .groupby("det_id")
     .agg(
-        {
-            **{
-                c: "first"
-                for c in [
-                    "source",
-                    "site_id",
-                    "mic_ht",
-                    "det_type",
-                    "mic_type",
-                    "refl_type",
-                    "wthr_prof",
-                    "call_id",
-                    "count_type",
-                ]
-            },
-            **{c: "unique" for c in ["dataset", "organization", "contributors", "site_name"]},
-            "night": "unique",
-            "spp_detections": "sum",
-        }
-    )
-    .reset_index()
-    .reset_index()
-    .rename(
-        columns={
-            "index": "id",
-            "night": "detector_nights",
-        }
+        **{c: (c, "first") for c in first_cols},
+        first_night=("night", "min"),
+        last_night=("night", "max"),
+        detector_nights=("night", "nunique"),
+        spp_detections=("spp_detections", "sum"),
     )
 )
 
-detectors["id"] = (detectors.id + 1).astype("uint16")
-det_id = detectors.set_index("det_id").id
-df["det_id"] = df.det_id.map(det_id)
-detectors = detectors.drop(columns=["det_id"])
+### normalize datasets, organizations, and contributors into tables of unique
+# values with stable IDs; detectors are linked to these by arrays of IDs, which
+# are resolved to names in the UI
+dimensions = {}
+for i, (col, name) in enumerate(
+    [("dataset", "datasets"), ("organization", "organizations"), ("contributors", "contributors")]
+):
+    dimensions[name], links = create_dimension(df.det_id, df[col], id_dir / f"{name}.feather")
+    detectors.insert(len(first_cols) + i, col, to_link_arrays(links, detectors.index))
 
-# set contributors and datasets to comma-delimited list
-for col in ["dataset", "organization", "contributors", "site_name"]:
-    detectors[col] = (
-        detectors[col].apply(",".join).apply(lambda x: ",".join([x for x in sorted(set(x.split(","))) if x != ""]))
-    )
+# dataset names were merged with their ID to construct a URL in the frontend
+dimensions["datasets"][["name", "dataset_id"]] = dimensions["datasets"].name.str.rsplit("|", n=1, expand=True)
+
+for name, table in dimensions.items():
+    write_table(table, static_data_dir / f"{name}.feather", profile="plain")
 
-# calculate date range and number of nights
-detectors["date_range"] = detectors.detector_nights.apply(sorted).apply(
-    lambda x: " - ".join(v.strftime("%b %d, %Y") for v in sorted(set([x[0], x[-1]])))
+# set site names to sorted comma-delimited list of unique values
+detectors.insert(
+    len(first_cols) + 3, "site_name", join_unique(df.det_id, df.site_name).reindex(detectors.index).fillna("")
 )
 
-detectors["detector_nights"] = detectors.detector_nights.apply(len)
+# calculate date range
+first_night = detectors.first_night.dt.strftime("%b %d, %Y")
+last_night = detectors.last_night.dt.strftime("%b %d, %Y")
+detectors["date_range"] = first_night.where(
+    detectors.first_night == detectors.last_night, first_night + " - " + last_night
+)
+detectors = detectors.drop(columns=["first_night", "last_night"]).reset_index()
+
+detectors.insert(0, "id", allocate_ids(detectors.det_id, id_dir / "detectors.feather"))
+det_id = detectors.set_index("det_id").id
+df["det_id"] = df.det_id.map(det_id)
+detectors = detectors.drop(columns=["det_id"])
+
 # detection nights are the sum of nights where there was activity in at least one activity column
 detection_nights = df.loc[df.spp_detections > 0].groupby("det_id").night.nunique()
 detectors["detection_nights"] = detectors.id.map(detection_nights).fillna(0).astype("uint")
@@ -650,9 +597,6 @@ for col in [
     "wthr_prof",
     "call_id",
     "count_type",
-    "dataset",
-    "organization",
-    "contributors",
     "site_name",
     "date_range",
     # "years",
@@ -661,8 +605,12 @@ for col in [
 ]:
     detectors[col] = detectors[col].astype("category")
 
-table = pa.Table.from_pandas(camelcase(detectors)).replace_schema_metadata()
-write_feather(table, static_data_dir / "detectors.feather", compression="uncompressed")
+write_table(
+    detectors,
+    static_data_dir / "detectors.feather",
+    profile=OUTPUT_PROFILE or select_profile("detectors", benchmark_results_filename),
+    sort_by=["id"],
+)
 
 
 ################################################################################
@@ -707,135 +655,120 @@ for col in ["species", "det_id", "year", "month", "detection_nights", "detector_
 
 spp_stats["detections"] = spp_stats.detections.astype(get_min_uint_dtype(spp_stats.detections.max())).astype("category")
 
-table = pa.Table.from_pandas(camelcase(spp_stats)).replace_schema_metadata()
-write_feather(table, static_data_dir / "spp_detections.feather", compression="uncompressed")
+write_table(
+    spp_stats,
+    static_data_dir / "spp_detections.feather",
+    profile=OUTPUT_PROFILE or select_profile("spp_detections", benchmark_results_filename),
+    sort_by=["species", "det_id", "year", "month"],
+)
 
+### write a shard per species so that the UI can load only the species being viewed
+# NOTE: shards use plain integer types instead of categories, which would
+# otherwise include the values of all species
+shard_cols = ["det_id", "year", "month", "detections", "detection_nights", "detector_nights"]
+spp_shards = spp_stats[["species"] + shard_cols].copy()
+for col in shard_cols:
+    spp_shards[col] = spp_shards[col].astype(spp_shards[col].cat.categories.dtype)
+spp_shards = spp_shards.astype({"year": "uint16", "month": "uint8"})
 
-################################################################################
-### Calculate contributor statistics
-################################################################################
-grouped = df.groupby("contributors")
-contributor_spp_detections = grouped[activity_columns].sum().sum(axis=1).astype("uint").rename("speciesDetections")
-# detector nights - total sampling effort
-contributor_nights = grouped.size().astype("uint").rename("detector_nights")
-contributor_detectors = grouped.det_id.nunique().rename("detectors")
-
-# need to pivot species columns to rows and calculate unique list of species per contributor
-# then count them up
-stacked = (
-    df.set_index("contributors")[activity_columns]
-    .stack(future_stack=True)
-    .dropna()
-    .rename("detections")
-    .reset_index()
-    .rename(columns={"level_1": "spp"})
-)
-# only keep species where there was > 0 activity detected
-contributor_species = stacked[stacked.detections > 0].groupby("contributors").spp.nunique().rename("speciesDetected")
-
-contributor_stats = (
-    pd.DataFrame(contributor_spp_detections)
-    .join(contributor_nights)
-    .join(contributor_detectors)
-    .join(contributor_species)
-    .fillna(0)
-    .astype("uint")
-    .reset_index()
-)
+spp_manifest = {}
+for spp, spp_id in SPECIES_ID.items():
+    shard = spp_shards.loc[spp_shards.species == spp_id, shard_cols]
+    if len(shard) == 0:
+        continue
 
+    filename = static_spp_data_dir / f"{spp}.feather"
+    write_table(shard, filename, profile="plain")
+    spp_manifest[spp] = {"filename": filename.name, "rows": len(shard), "bytes": filename.stat().st_size}
 
-################################################################################
-### Calculate species statistics
-################################################################################
+# remove shards of species no longer present
+for filename in static_spp_data_dir.glob("*.feather"):
+    if filename.stem not in spp_manifest:
+        filename.unlink()
 
-# Total activity by species - only where activity was being recorded
-presence_ix = df.count_type == "p"
-spp_detections = df[activity_columns].sum().astype("uint").rename("detections")
-# presence only detections are the same as detection nights
-spp_po_detections = df.loc[presence_ix, activity_columns].sum().astype("uint").rename("presence_only_detections")
+(static_spp_data_dir / "manifest.json").write_text(json.dumps(spp_manifest, indent=2))
 
-# Count total nights of detections and nondetections - ONLY for species columns
-spp_detector_nights = (df[activity_columns] >= 0).sum().rename("detector_nights")
-spp_po_detector_nights = (df.loc[presence_ix, activity_columns] >= 0).sum().rename("presence_only_detector_nights")
 
-# Count of non-zero nights by species
-spp_detection_nights = (df[activity_columns] > 0).sum().rename("detection_nights")
+################################################################################
+### Create occurrence cube
+################################################################################
+# species detections are joined to detector attributes and aggregated across
+# detectors at each site here so that the occurrence map does not need to join
+# and roll up all detector-level data before it can show anything
+# NOTE: H3 hexagons and state / province are attributes of the site, so
+# including them does not increase the number of rows
+occurrence_cols = ["species", "year", "month", "site_id"] + H3_COLS + ["admin1_name", "source", "count_type"]
 
-# pivot species then tally up count of unique contributors for each
-spp_contributors = (
-    df.set_index("contributors")[activity_columns]
-    .stack(future_stack=True)
-    .dropna()
-    .rename("detections")
+occurrence = (
+    spp_shards.join(
+        detectors.set_index("id")[["site_id", "source", "count_type", "admin1_name"] + H3_COLS], on="det_id"
+    )
+    .groupby(occurrence_cols, observed=True)
+    .agg(
+        {
+            "detections": "sum",
+            "detection_nights": "sum",
+            "detector_nights": "sum",
+            "det_id": "nunique",
+        }
+    )
+    .rename(columns={"det_id": "detectors"})
     .reset_index()
-    .rename(columns={"level_1": "species"})
-    .groupby("species")
-    .contributors.nunique()
-    .rename("contributors")
 )
 
-spp_detectors = (
-    df.set_index("det_id")[activity_columns]
-    .stack(future_stack=True)
-    .dropna()
-    .rename("detections")
-    .reset_index()
-    .rename(columns={"level_1": "species"})
-    .groupby("species")
-    .det_id.nunique()
-    .rename("detectors")
-)
+for col in ["detections", "detection_nights", "detector_nights", "detectors"]:
+    occurrence[col] = occurrence[col].astype(get_min_uint_dtype(occurrence[col].max()))
 
-spp_po_detectors = (
-    df.loc[presence_ix]
-    .set_index("det_id")[activity_columns]
-    .stack(future_stack=True)
-    .dropna()
-    .rename("detections")
-    .reset_index()
-    .rename(columns={"level_1": "species"})
-    .groupby("species")
-    .det_id.nunique()
-    .rename("presecence_only_detectors")
-)
+for col in occurrence_cols:
+    occurrence[col] = occurrence[col].astype("category")
 
-spp_stats = (
-    pd.DataFrame(spp_detections)
-    .join(spp_po_detections)
-    .join(spp_detector_nights)
-    .join(spp_po_detector_nights)
-    .join(spp_detection_nights)
-    .join(spp_contributors)
-    .join(spp_detectors)
-    .join(spp_po_detectors)
+write_table(
+    occurrence,
+    static_data_dir / "occurrence.feather",
+    profile=OUTPUT_PROFILE or select_profile("occurrence", benchmark_results_filename),
+    sort_by=["species", "year", "month", "site_id", "source", "count_type"],
 )
 
-# add any missing species we want listed but haven't yet been monitored
-missing_spps = pd.DataFrame([], index=[spp for spp in SPECIES_ID if spp not in spp_stats.index])
-spp_stats = pd.concat([spp_stats, missing_spps], ignore_index=False)
+# values used to populate filters of the occurrence map
+occurrence_filters = {
+    "admin1Name": sorted(occurrence.admin1_name.unique().astype(str).tolist()),
+    "species": sorted(occurrence.species.unique().astype(str).tolist()),
+    "years": sorted(occurrence.year.unique().astype(int).tolist()),
+}
+(static_data_dir / "occurrence_filters.json").write_text(json.dumps(occurrence_filters))
 
-spp_stats = spp_stats.fillna(0).astype("uint").reset_index().rename(columns={"index": "species"}).sort_values("species")
 
 ################################################################################
-### Calculate high-level summary statistics
+### Calculate contributor, species, and summary statistics
 ################################################################################
+# statistics are accumulated per source and year in a single pass over the
+# records; these are saved so that statistics of new records can be merged in
+# later without recalculating all partitions
+# NOTE: records are keyed by the ID of their set of contributors, which is
+# linked to the IDs of individual contributors
+contributors = df.contributors.fillna("")
+set_keys = pd.Series(contributors.unique())
+contributor_set = pd.Series(allocate_ids(set_keys, id_dir / "contributor_sets.feather"), index=set_keys.values)
+_, links = create_dimension(set_keys, set_keys, id_dir / "contributors.feather")
+contributor_sets = pd.DataFrame(
+    {"contributor_set": links.group.map(contributor_set).values, "contributor": links.id.values}
+)
+
+stats = StatsAccumulator.from_records(df.assign(contributor_set=contributors.map(contributor_set)), activity_columns)
+stats.write(derived_dir / "stats")
+
+contributor_stats = stats.get_contributor_stats(contributor_sets)
+contributor_stats.insert(
+    0, "contributors", contributor_stats.pop("contributor").map(dimensions["contributors"].set_index("id").name)
+)
+contributor_stats = contributor_stats.sort_values("contributors", ignore_index=True)
+spp_stats = stats.get_species_stats(SPECIES_ID, contributor_sets)
 
 summary = {
     "admin1": sorted(sites.admin1_name.unique().astype(str).tolist()),
-    "speciesDetected": (df[activity_columns] > 0).max().sum().item(),
     "speciesSurveyed": len(activity_columns),
     "contributors": len(contributor_stats),
-    "detectors": len(detectors),
-    "activityDetectors": (detectors.count_type == "a").sum().item(),
-    "presenceDetectors": (detectors.count_type == "p").sum().item(),
-    "speciesDetections": df[activity_columns].sum().sum().item(),
-    # detector_nights are sampling activity
-    "detectorNights": len(df),
-    "activityDetectorNights": (df.count_type == "a").sum().item(),
-    "presenceDetectorNights": (df.count_type == "p").sum().item(),
-    # detection_nights are nights where at least one species was detected
-    "detectionNights": (df.spp_detections > 0).sum().item(),
-    "years": sorted([x.item() for x in df.year.unique()]),
+    **stats.get_summary(),
     "contributorsTable": camelcase(contributor_stats).to_dict(orient="list"),
     "speciesTable": camelcase(spp_stats).to_dict(orient="list"),
 }
@@ -1,58 +1,81 @@
 import asyncio
+import json
 import os
 from pathlib import Path
 
 from dotenv import load_dotenv, find_dotenv
-import httpx
 
 from analysis.nabat.lib import (
+    NABatClient,
     parse_R_token_cmd,
-    refresh_auth_token,
     get_all_species,
     get_user_projects,
     get_project_info,
-    get_stationary_acoustic_counts,
+    sync_stationary_acoustic_counts,
+    combine_stationary_acoustic_counts,
+    is_combined_up_to_date,
+    write_combined_counts,
 )
 
 load_dotenv(find_dotenv())
 
 NABAT_REFRESH_TOKEN = parse_R_token_cmd(os.getenv("NABAT_TOKEN_CMD"))
 
+# set to True to re-download the species list and all projects instead of only
+# projects that changed since the last download
+FULL_REFRESH = False
+
 
 data_dir = Path("data/source/nabat")
 data_dir.mkdir(exist_ok=True, parents=True)
 
 
 async def download():
-    async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=60.0), http2=True) as client:
+    # NOTE: all requests share a single HTTP/2 connection and the access token
+    # is automatically refreshed before it expires
+    async with NABatClient(NABAT_REFRESH_TOKEN) as client:
         # use refresh token to get fresh access token and user_id
         print("Fetching user access token")
-        info = await refresh_auth_token(client, NABAT_REFRESH_TOKEN)
-        token = info["access_token"]
-        user_id = info["user_id"]
+        await client.token.get()
+        user_id = client.user_id
 
         print(f"user_id: {user_id}")
 
         # download full species list
         # NOTE: only needs to be run when species list changes in NABat
-        print("Downloading species list")
-        spp_df = await get_all_species(client, token)
-        spp_df.to_feather(data_dir / "all_species.feather")
+        if FULL_REFRESH or not (data_dir / "all_species.feather").exists():
+            print("Downloading species list")
+            spp_df = await get_all_species(client)
+            spp_df.to_feather(data_dir / "all_species.feather")
 
         # get IDs of user projects and then use those to fetch additional project details
         print("Downloading user projects")
-        user_projects = await get_user_projects(client, token, user_id)
+        user_projects = await get_user_projects(client, user_id)
         project_ids = user_projects.id.values.tolist()
 
         # download project info for above projects
         print("Downloading project info")
-        project_df = await get_project_info(client, token, project_ids)
+        project_df = await get_project_info(client, project_ids)
         project_df.to_feather(data_dir / "projects.feather")
 
-        # download stationary counts
+        # download stationary counts for new or changed projects
         print("Downloading stationary acoustic counts")
-        records = await get_stationary_acoustic_counts(client, token, project_ids)
-        records.to_feather(data_dir / "stationary_acoustic_counts.feather")
+        changed = await sync_stationary_acoustic_counts(client, project_df, data_dir, full=FULL_REFRESH)
+
+        # NOTE: counts must also be combined if projects were synced by a
+        # previous run that failed before combining them
+        outfilename = data_dir / "stationary_acoustic_counts.feather"
+        if changed or not is_combined_up_to_date(data_dir, outfilename):
+            print("Combining stationary acoustic counts")
+            records = combine_stationary_acoustic_counts(data_dir)
+            write_combined_counts(records, data_dir, outfilename)
+        else:
+            print("No projects changed; stationary acoustic counts are up to date")
+
+        # summarize latency, size, and retries of requests by operation
+        summary = json.dumps(client.stats.summary(), indent=2)
+        (data_dir / "request_stats.json").write_text(summary)
+        print(f"NABat requests:\n{summary}")
 
 
 asyncio.run(download())
@@ -1,14 +1,30 @@
 from analysis.nabat.lib.bulk import get_stationary_acoustic_counts
+from analysis.nabat.lib.client import NABatClient
 from analysis.nabat.lib.projects import get_user_projects, get_project_info
 from analysis.nabat.lib.species import get_all_species
-from analysis.nabat.lib.user import get_user_id, parse_R_token_cmd, refresh_auth_token
+from analysis.nabat.lib.sync import (
+    sync_stationary_acoustic_counts,
+    combine_stationary_acoustic_counts,
+    is_combined_up_to_date,
+    write_combined_counts,
+)
+from analysis.nabat.lib.request import RequestStats, post_query
+from analysis.nabat.lib.user import AccessToken, get_user_id, parse_R_token_cmd, refresh_auth_token
 
 __all__ = [
+    AccessToken,
+    NABatClient,
+    RequestStats,
     get_all_species,
     get_user_projects,
     get_project_info,
     get_stationary_acoustic_counts,
+    sync_stationary_acoustic_counts,
+    combine_stationary_acoustic_counts,
+    is_combined_up_to_date,
+    write_combined_counts,
     get_user_id,
+    post_query,
     parse_R_token_cmd,
     refresh_auth_token,
 ]
@@ -1,99 +1,245 @@
+import asyncio
+import time
+
 import geopandas as gp
+import ijson
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import shapely
 
-from analysis.constants import GEO_CRS, NABAT_URL
+from analysis.constants import GEO_CRS
+from analysis.nabat.lib.request import Timer
+
+
+QUERY = """
+query visualizationData($surveyType: Int!, $grtsOnly: Boolean!, $projectIds: [Int]!, $years: [Int]!, $months: [Int]!, $speciesIds: [Int]!, $genericSpecies: Boolean, $organizationIds: [Int]!, $cqlFilterKey: String) {
+    visualizationData(
+        surveyType: $surveyType
+        grtsOnly: $grtsOnly
+        projectIds: $projectIds
+        years: $years
+        months: $months
+        speciesIds: $speciesIds
+        genericSpecies: $genericSpecies
+        organizationIds: $organizationIds
+        cqlFilterKey: $cqlFilterKey
+    ) {
+        headers
+        body
+    }
+}
+"""
+
+
+# columns that are dropped when reading visualizationData
+DROP_COLUMNS = ["year", "month", "day"]
+
+# dates are parsed from first 15 characters (intentionally drop time component)
+DATE_COLUMNS = ["night", "start_time", "end_time"]
+
+BOOL_COLUMNS = ["sample_design"]
 
+GEOMETRY_COLUMNS = ["grts_geometry", "geometry"]
 
-async def get_stationary_acoustic_counts(client, token, project_ids):
-    """Download CSV structured table of nightly counts by species and detector
+STRING_COLUMNS = [
+    "project_name",
+    "organization_name",
+    "location_name",
+    "sample_frame",
+    "habitat_type",
+    "species_list",
+    "software",
+    "detector",
+    "microphone",
+    "microphone_orientation",
+    "clutter",
+]
+
+COLUMN_TYPES = {
+    "species_id": pa.uint8(),
+    "project_id": pa.uint64(),
+    "grts_cell_id": pa.uint64(),
+    "grts_id": pa.uint64(),
+    "batch_id": pa.uint64(),
+    "event_id": pa.uint64(),
+    "organization_id": pa.uint64(),
+    # allow null IDs: software may have been left blank; event_geometry_id
+    # is missing when geometry not provided by user or allowed via data
+    # access
+    "software_id": pa.uint64(),
+    "event_geometry_id": pa.uint64(),
+    # allow null counts
+    "count_auto_id": pa.uint64(),
+    "count_vetted": pa.uint64(),
+    "reviewed": pa.uint64(),
+    "confirmed": pa.uint64(),
+    "microphone_height_meters": pa.float32(),
+    "distance_to_clutter_meters": pa.float32(),
+    "clutter_percent": pa.float32(),
+    "distance_to_water": pa.float32(),
+}
+
+# number of rows decoded into Python lists before converting to Arrow
+BATCH_SIZE = 100_000
+
+
+def to_arrow_column(name, values):
+    """Convert values for a single column of visualizationData into a typed
+    Arrow array.
 
     Parameters
     ----------
-    client : httpx.AsyncClient
-    token : str
-        NABat token
-    project_ids : list
-        list of project IDs
+    name : str
+        column name
+    values : sequence
+        decoded JSON values
 
     Returns
     -------
-    DataFrame
+    pyarrow.Array
     """
-    query = """
-    query visualizationData($surveyType: Int!, $grtsOnly: Boolean!, $projectIds: [Int]!, $years: [Int]!, $months: [Int]!, $speciesIds: [Int]!, $genericSpecies: Boolean, $organizationIds: [Int]!, $cqlFilterKey: String) {
-        visualizationData(
-            surveyType: $surveyType
-            grtsOnly: $grtsOnly
-            projectIds: $projectIds
-            years: $years
-            months: $months
-            speciesIds: $speciesIds
-            genericSpecies: $genericSpecies
-            organizationIds: $organizationIds
-            cqlFilterKey: $cqlFilterKey
-        ) {
-            headers
-            body
-        }
-    }
+    if name in GEOMETRY_COLUMNS:
+        # geometries are returned as hex-encoded WKB
+        return pa.array([bytes.fromhex(v) if v is not None else None for v in values], type=pa.binary())
+
+    # values may be encoded as strings or numbers; infer type then cast
+    try:
+        arr = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # mix of strings and numbers
+        arr = pa.array([str(v) if v is not None else None for v in values], type=pa.string())
+
+    if name in DATE_COLUMNS:
+        # dates are formatted like "Mon Jun 01 2020 00:00:00 GMT-0600"
+        values = pc.utf8_slice_codeunits(arr.cast(pa.string()), 0, 15)
+        try:
+            return pc.strptime(values, format="%a %b %d %Y", unit="s")
+        except pa.ArrowInvalid:
+            # not in expected format; fall back to slower parsing in pandas
+            dates = pd.to_datetime(values.to_pandas(), format="mixed")
+            return pa.array(dates.astype("datetime64[s]"), type=pa.timestamp("s"))
+
+    if name in BOOL_COLUMNS:
+        # anything other than "false" is considered True
+        return pc.fill_null(pc.not_equal(arr.cast(pa.string()), "false"), True)
+
+    if name in STRING_COLUMNS:
+        return pc.utf8_trim_whitespace(pc.fill_null(arr.cast(pa.string()), ""))
+
+    if name in COLUMN_TYPES:
+        return arr.cast(COLUMN_TYPES[name])
+
+    return arr
+
+
+def rows_to_table(headers, rows):
+    """Convert a batch of rows of visualizationData into an Arrow table.
+
+    Parameters
+    ----------
+    headers : list of str
+    rows : list of lists
+
+    Returns
+    -------
+    pyarrow.Table
     """
+    columns = zip(*rows) if rows else [[] for _ in headers]
 
-    merged = None
-    for project_id in project_ids:
-        print(f"Fetching project {project_id} from NABat")
-
-        request = await client.post(
-            NABAT_URL,
-            json={
-                "operationName": "visualizationData",
-                "query": query,
-                "variables": {
-                    # seems that 7 or 70 produce same output?
-                    "surveyType": 70,
-                    "chartType": "species",
-                    "projectIds": [project_id],
-                    "years": [],
-                    "months": [],
-                    "organizationIds": [],
-                    "speciesIds": [],
-                    "presetSpeciesList": [],
-                    "grtsOnly": False,
-                    "genericSpecies": False,
-                },
-            },
-            headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
-        )
-        request.raise_for_status()
-
-        raw = request.json()["data"]["visualizationData"]
-        df = (
-            pd.DataFrame(raw["body"], columns=raw["headers"])
-            .drop(
-                columns=[
-                    "year",
-                    "month",
-                    "day",
-                ]
-            )
-            .rename(columns={"start_time": "start_date", "end_time": "end_date"})
-        )
+    return pa.table(
+        {name: to_arrow_column(name, values) for name, values in zip(headers, columns) if name not in DROP_COLUMNS}
+    )
+
+
+async def read_project_counts(response, decode_timer=None, batch_size=BATCH_SIZE):
+    """Incrementally decode streaming visualizationData response into an Arrow
+    table.
+
+    Rows are decoded from the response as it is downloaded and converted into
+    typed Arrow columns in batches of batch_size rows, so that only the current
+    batch of rows is held as Python objects.
+
+    Parameters
+    ----------
+    response : httpx.Response
+        streaming response
+    decode_timer : Timer, optional (default: None)
+        if provided, time spent decoding rows and converting them to Arrow is
+        accumulated here, separately from time spent downloading the response
+    batch_size : int, optional (default: BATCH_SIZE)
+        number of rows to convert to Arrow at a time
+
+    Returns
+    -------
+    pyarrow.Table
+    """
+    header_events = ijson.sendable_list()
+    header_parser = ijson.items_coro(header_events, "data.visualizationData.headers")
+    row_events = ijson.sendable_list()
+    row_parser = ijson.items_coro(row_events, "data.visualizationData.body.item", use_float=True)
+
+    if decode_timer is None:
+        decode_timer = Timer()
 
-        if len(df) > 0:
-            if merged is None:
-                merged = df
-            else:
-                merged = pd.concat([merged, df], ignore_index=True)
+    headers = None
+    rows = []
+    tables = []
 
-    df = merged
+    async for chunk in response.aiter_bytes():
+        with decode_timer:
+            # headers are returned before body, stop parsing them once found
+            if headers is None:
+                header_parser.send(chunk)
+                if header_events:
+                    headers = header_events[0]
 
-    # parse dates (intentionally drop time component)
-    for col in ["night", "start_date", "end_date"]:
-        df[col] = pd.to_datetime(df[col].str[:15]).astype("datetime64[s]")
+            row_parser.send(chunk)
+            rows.extend(row_events)
+            del row_events[:]
 
-    for col in ["species_id"]:
-        df[col] = df[col].astype("uint8")
+            if headers is not None and len(rows) >= batch_size:
+                tables.append(rows_to_table(headers, rows))
+                rows = []
 
+    with decode_timer:
+        row_parser.close()
+        rows.extend(row_events)
+
+        if headers is None:
+            header_parser.close()
+            if not header_events:
+                raise RuntimeError("NABat response did not include visualizationData")
+
+            headers = header_events[0]
+
+        if rows or not tables:
+            tables.append(rows_to_table(headers, rows))
+
+        return pa.concat_tables(tables, promote_options="permissive")
+
+
+def parse_project_counts(table):
+    """Convert Arrow table of counts for a single project into a data frame
+    with standardized types.
+
+    Geometry columns are left as WKB.
+
+    Parameters
+    ----------
+    table : pyarrow.Table
+        as returned by read_project_counts
+
+    Returns
+    -------
+    DataFrame
+    """
+    df = table.to_pandas(types_mapper={pa.uint64(): pd.UInt64Dtype()}.get).rename(
+        columns={"start_time": "start_date", "end_time": "end_date"}
+    )
+
+    # these IDs are never null; convert from nullable type
     for col in [
         "project_id",
         "grts_cell_id",
@@ -104,85 +250,170 @@ async def get_stationary_acoustic_counts(client, token, project_ids):
     ]:
         df[col] = df[col].astype("uint")
 
-    for col in ["software_id", "event_geometry_id"]:
-        # allow null IDs: software may have been left blank; event_geometry_id
-        # is missing when geometry not provided by user or allowed via data
-        # access
-        df[col] = df[col].astype("UInt64")
+    return df
 
-    # allow null counts
-    for col in ["count_auto_id", "count_vetted", "reviewed", "confirmed"]:
-        df[col] = df[col].astype("UInt64")
 
-    for col in [
-        "microphone_height_meters",
-        "distance_to_clutter_meters",
-        "clutter_percent",
-        "distance_to_water",
-    ]:
-        df[col] = df[col].astype("float32")
+async def fetch_project(client, project_id):
+    """Download nightly counts by species and detector for a single project.
 
-    # parse bool columns
-    for col in ["sample_design"]:
-        df[col] = df[col].map({"false": False, "true": "True"}).astype("bool")
+    Parameters
+    ----------
+    client : NABatClient
+    project_id : int
 
-    for col in [
-        "project_name",
-        "organization_name",
-        "location_name",
-        "sample_frame",
-        "habitat_type",
-        "species_list",
-        "software",
-        "detector",
-        "microphone",
-        "microphone_orientation",
-        "clutter",
-    ]:
-        df[col] = df[col].fillna("").str.strip()
+    Returns
+    -------
+    DataFrame
+    """
+    table = await client.query(
+        "visualizationData",
+        QUERY,
+        {
+            # seems that 7 or 70 produce same output?
+            "surveyType": 70,
+            "chartType": "species",
+            "projectIds": [project_id],
+            "years": [],
+            "months": [],
+            "organizationIds": [],
+            "speciesIds": [],
+            "presetSpeciesList": [],
+            "grtsOnly": False,
+            "genericSpecies": False,
+        },
+        read=read_project_counts,
+    )
 
-    grts_cells = df.groupby("grts_cell_id")[["grts_geometry"]].first()
-    grts_cells["grts_geometry"] = shapely.from_wkb(grts_cells.grts_geometry.values)
-    grts_cells["grts_centroid"] = shapely.centroid(grts_cells.grts_geometry.values)
+    return parse_project_counts(table)
 
-    # geometry will be null where precise coordinates are not shared; use GRTS centroids for these
-    df = gp.GeoDataFrame(
-        df.drop(columns=["grts_geometry"]).join(grts_cells, on="grts_cell_id"),
-        geometry=shapely.from_wkb(df.geometry.values),
-        crs=GEO_CRS,
+
+async def fetch_project_counts(client, project_ids, max_concurrency=4):
+    """Download nightly counts by species and detector for each project.
+    Projects are downloaded concurrently.
+
+    Parameters
+    ----------
+    client : NABatClient
+    project_ids : list
+        list of project IDs
+    max_concurrency : int, optional (default: 4)
+        maximum number of projects to download at the same time
+
+    Returns
+    -------
+    list of DataFrames
+        one per project, in same order as project_ids
+    """
+    num_projects = len(project_ids)
+    num_completed = 0
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch(project_id):
+        nonlocal num_completed
+
+        async with semaphore:
+            start = time.time()
+            df = await fetch_project(client, project_id)
+
+        num_completed += 1
+        print(
+            f"Fetched project {project_id} from NABat ({len(df):,} records) in {time.time() - start:.2f}s [{num_completed}/{num_projects}]"
+        )
+
+        return df
+
+    # results are returned in same order as project_ids
+    return await asyncio.gather(*[fetch(id) for id in project_ids])
+
+
+def merge_project_counts(merged):
+    """Merge nightly counts downloaded for each project and resolve geometries
+    and event geometry IDs across all projects.
+
+    Parameters
+    ----------
+    merged : list of DataFrames
+        one per project, as returned by fetch_project_counts
+
+    Returns
+    -------
+    GeoDataFrame
+    """
+    # concatenate all projects at once to avoid recopying previously merged
+    # projects
+    df = pd.concat([df for df in merged if len(df) > 0], ignore_index=True)
+
+    # calculate GRTS centroids once per GRTS cell, using first non-null
+    # GRTS geometry for each cell
+    cell_ix, cells = pd.factorize(df.grts_cell_id)
+    has_grts = df.grts_geometry.notnull().values
+    _, first_ix = np.unique(cell_ix[has_grts], return_index=True)
+    grts_centroids = np.full(len(cells), None, dtype="object")
+    grts_centroids[cell_ix[has_grts][first_ix]] = shapely.centroid(
+        shapely.from_wkb(df.grts_geometry.values[has_grts][first_ix])
     )
 
+    # decode geometry once per distinct WKB value
+    geom_ix, wkb = pd.factorize(df.geometry)
+    geoms = shapely.from_wkb(np.asarray(wkb, dtype="object"))
+
     # there may be some polygon geometry data (most likely equivalent to GRTS cell boundary); take the centroid
-    ix = df.geometry.type == "Polygon"
+    ix = shapely.get_type_id(geoms) == shapely.GeometryType.POLYGON
     if ix.any():
-        df.loc[ix, "geometry"] = shapely.centroid(df.loc[ix].geometry.values)
+        geoms[ix] = shapely.centroid(geoms[ix])
 
-    if (df.loc[df.geometry.notnull()].geometry.type != "Point").any():
+    if (shapely.get_type_id(geoms) != shapely.GeometryType.POINT).any():
         raise RuntimeError(
             "Found non-point geometries in data from NABat; these need to be specifically handled in the data pipeline"
         )
 
-    # set those without geometry to GRTS centroid
-    ix = df.geometry.isnull()
-    df.loc[ix, "geometry"] = df.loc[ix].grts_centroid.values
+    # geometry will be null where precise coordinates are not shared; use GRTS centroids for these
+    ix = geom_ix == -1
+    geometry = grts_centroids.take(cell_ix)
+    geometry[~ix] = geoms.take(geom_ix[~ix])
 
     # NOTE: these won't have an event_geometry_id set, so we have to create one
     # combination of point and project should be sufficient to resolve a unique
     # event ID for these; if there are multiple concurrent observations they'll
     # be coalesced to GRTS centroids anyway, so we'll deal with those during dedup steps
-    tmp = pd.DataFrame(
-        df.loc[ix]
-        .reset_index()
-        .groupby(["project_id", "geometry"])
-        .index.unique()
-        .rename("prev_index")
-        .reset_index(drop=True)
-    )
-    start_id = df.event_geometry_id.max() + 1
-    tmp["event_geometry_id"] = (start_id + tmp.index.values).astype("uint")
-    tmp = tmp.explode("prev_index").set_index("prev_index").event_geometry_id
-    df.loc[ix, "event_geometry_id"] = df.loc[ix].index.map(tmp)
+    event_geometry_id = df.event_geometry_id.values.copy()
+    if ix.any():
+        # GRTS cells may share the same centroid; factorize centroids (in order
+        # of appearance) and sort them the same way as pandas sorts geometries
+        # (by Hilbert distance) so that IDs are assigned in the same order as
+        # grouping by project and geometry
+        cell_centroid_ix = pd.factorize(shapely.to_wkb(grts_centroids))[0]
+        first_cell_ix = np.unique(cell_centroid_ix, return_index=True)[1]
+        centroid_ix, centroids = pd.factorize(cell_centroid_ix.take(cell_ix[ix]))
+        order = gp.GeoSeries(grts_centroids.take(first_cell_ix.take(centroids))).values.argsort()
+        rank = np.empty(len(order), dtype="int64")
+        rank[order] = np.arange(len(order))
 
-    df["event_geometry_id"] = df.event_geometry_id.astype("uint")
+        key = df.project_id.values[ix].astype("int64") * len(centroids) + rank.take(centroid_ix)
+        start_id = df.event_geometry_id.max() + 1
+        event_geometry_id[ix] = start_id + pd.factorize(key, sort=True)[0].astype("uint")
+
+    df["event_geometry_id"] = event_geometry_id.astype("uint")
+
+    return gp.GeoDataFrame(df.drop(columns=["grts_geometry"]), geometry=geometry, crs=GEO_CRS)
+
+
+async def get_stationary_acoustic_counts(client, project_ids, max_concurrency=4):
+    """Download CSV structured table of nightly counts by species and detector.
+    Projects are downloaded concurrently.
+
+    Parameters
+    ----------
+    client : NABatClient
+    project_ids : list
+        list of project IDs
+    max_concurrency : int, optional (default: 4)
+        maximum number of projects to download at the same time
+
+    Returns
+    -------
+    DataFrame
+    """
+    merged = await fetch_project_counts(client, project_ids, max_concurrency=max_concurrency)
 
-    return df.drop(columns=["grts_geometry", "grts_centroid"])
+    return merge_project_counts(merged)
@@ -1,6 +1,8 @@
 import warnings
 
 import geopandas as gp
+import numpy as np
+import pandas as pd
 
 from analysis.constants import GEO_CRS, ACTIVITY_COLUMNS
 from analysis.lib.util import from_camelcase
@@ -36,56 +38,33 @@ def clean_nabat(df):
     # round mic_ht to 2 decimals
     df["mic_ht"] = df.mic_ht.round(2)
 
-    # there are occasionally duplicates by species / night / height / event geometry;
-    # these appear to have been uploaded multiple times
-    df = (
-        df.groupby(["event_geometry_id", "night", "mic_ht", "species_code"], dropna=False)
-        .agg(
-            {
-                "count_vetted": "max",
-                **{
-                    c: "first"
-                    for c in df.columns
-                    if c not in {"event_geometry_id", "night", "mic_ht", "species_code", "count_vetted"}
-                },
-            }
-        )
-        .reset_index()
-    )
+    # pivot by species / night / height / event geometry
+    # NOTE: there are occasionally duplicates by species / night / height / event
+    # geometry; these appear to have been uploaded multiple times, so we take
+    # the max count across duplicates
+    key_cols = ["event_geometry_id", "night", "mic_ht"]
 
     # there are some duplicates where mic_ht is null for some but not all; strip
     # those out
-    s = df.groupby(["event_geometry_id", "night", "species_code"]).mic_ht.unique().apply(len).rename("count")
-    s = s[s > 1]
-    df = df.set_index(["event_geometry_id", "night", "species_code"])
-    df = df.loc[~(df.mic_ht.isnull() & df.index.isin(s.index))].reset_index()
+    spp_key = df.groupby(["event_geometry_id", "night", "species_code"], dropna=False).ngroup().values
+    has_ht = np.bincount(spp_key, weights=df.mic_ht.notnull().values) > 0
+    df = df.loc[~(df.mic_ht.isnull().values & has_ht[spp_key])]
+
+    # factorize key (sorted, nulls last) and species into integer codes
+    key = df.groupby(key_cols, dropna=False).ngroup().values
+    spp = pd.Categorical(df.species_code.values, categories=ACTIVITY_COLUMNS).codes
+    first_ix = np.unique(key, return_index=True)[1]
+
+    # scatter max count into a key x species matrix; -1 indicates null
+    counts = np.full((len(first_ix), len(ACTIVITY_COLUMNS)), -1, dtype="int64")
+    np.maximum.at(counts, (key, spp), df.count_vetted.astype("Int64").fillna(-1).values.astype("int64"))
+
+    # take attributes from the first record for each key
+    df = df.iloc[first_ix].drop(columns=["species_code", "count_vetted"]).reset_index(drop=True)
+    df = df[key_cols + [c for c in df.columns if c not in key_cols]]
+    for i in np.unique(spp):
+        df[ACTIVITY_COLUMNS[i]] = pd.arrays.IntegerArray(counts[:, i].clip(0).astype("uint64"), counts[:, i] < 0)
 
-    # pivot by species / night / height / event geometry
-    df = (
-        df.groupby(["event_geometry_id", "night", "mic_ht"], dropna=False)
-        .agg(
-            {
-                c: "first"
-                for c in df.columns
-                if c
-                not in {
-                    "event_geometry_id",
-                    "night",
-                    "mic_ht",
-                    "species_code",
-                    "count_vetted",
-                }
-            }
-        )
-        .join(
-            df[["event_geometry_id", "night", "mic_ht", "species_code", "count_vetted"]].pivot(
-                columns=["species_code"],
-                index=["event_geometry_id", "night", "mic_ht"],
-                values="count_vetted",
-            )
-        )
-        .reset_index()
-    )
     df = gp.GeoDataFrame(df, geometry="geometry", crs=GEO_CRS)
 
     ### clean site name
@@ -0,0 +1,88 @@
+import httpx
+
+from analysis.nabat.lib.request import RequestStats, post_query
+from analysis.nabat.lib.user import AccessToken
+
+
+class NABatClient(object):
+    def __init__(self, refresh_token, http_client=None, retries=4, backoff=2):
+        """Client for the NABat GraphQL API used for all requests to NABat.
+
+        All requests share a single HTTP/2 connection pool, use an access token
+        that is automatically refreshed before it expires, are retried on
+        server errors and timeouts, and are recorded in stats.
+
+        Use as an async context manager:
+        async with NABatClient(refresh_token) as client:
+            ...
+
+        Parameters
+        ----------
+        refresh_token : str
+            NABat refresh token
+        http_client : httpx.AsyncClient, optional (default: None)
+            if provided, used to send requests instead of creating a new client;
+            it is not closed when this client is closed
+        retries : int, optional (default: 4)
+            maximum number of times to retry each request
+        backoff : int, optional (default: 2)
+            number of seconds to wait before first retry; this is doubled for
+            each subsequent retry
+        """
+        self.http_client = http_client
+        self._owns_http_client = http_client is None
+        self.retries = retries
+        self.backoff = backoff
+        self.token = AccessToken(self, refresh_token)
+        self.stats = RequestStats()
+
+    async def __aenter__(self):
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=60.0), http2=True)
+
+        return self
+
+    async def __aexit__(self, *args):
+        if self._owns_http_client:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    @property
+    def user_id(self):
+        """NABat user ID; only available after access token has been fetched"""
+        return self.token.user_id
+
+    async def query(self, operation, query, variables=None, read=None, authenticate=True):
+        """POST GraphQL query to NABat
+
+        Parameters
+        ----------
+        operation : str
+            GraphQL operation name
+        query : str
+            GraphQL query
+        variables : dict, optional (default: None)
+            GraphQL query variables
+        read : async function, optional (default: None)
+            if provided, called with the streaming response and a Timer to read
+            its body instead of parsing the entire response as JSON; see
+            post_query
+        authenticate : bool, optional (default: True)
+            if False, request is sent without the access token
+
+        Returns
+        -------
+        dict
+            data returned by query, or result of read if provided
+        """
+        return await post_query(
+            self.http_client,
+            self.token if authenticate else None,
+            operation,
+            query,
+            variables=variables,
+            retries=self.retries,
+            backoff=self.backoff,
+            read=read,
+            stats=self.stats,
+        )
@@ -1,16 +1,12 @@
 import pandas as pd
 
-from analysis.constants import NABAT_URL
 
-
-async def get_user_projects(client, token, user_id):
+async def get_user_projects(client, user_id):
     """Download lookup table of all projects user has a role in.
 
     Parameters
     ----------
-    client : httpx.AsyncClient,
-    token : str
-        NABat token
+    client : NABatClient
     user_id : int
         user ID
 
@@ -28,33 +24,22 @@ async def get_user_projects(client, token, user_id):
     }
     """
 
-    request = await client.post(
-        NABAT_URL,
-        json={
-            "operationName": "allVwUserProjects",
-            "query": query,
-            "variables": {"userId": user_id},
-        },
-        headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
-    )
-    request.raise_for_status()
+    data = await client.query("allVwUserProjects", query, {"userId": user_id})
 
     # projects may appear multiple times if requesting user has multiple roles in project
-    df = pd.DataFrame(request.json()["data"]["allVwUserProjects"]["nodes"]).drop_duplicates(subset="id")
+    df = pd.DataFrame(data["allVwUserProjects"]["nodes"]).drop_duplicates(subset="id")
     df["id"] = df.id.astype("uint")
     df["name"] = df.name.fillna("").str.strip()
 
     return df
 
 
-async def get_project_info(client, token, project_ids):
+async def get_project_info(client, project_ids):
     """Get project metadata for specified projects
 
     Parameters
     ----------
-    client : httpx.AsyncClient
-    token : str
-        NABat token
+    client : NABatClient
     project_ids : list
         list of project IDs
 
@@ -114,28 +99,15 @@ async def get_project_info(client, token, project_ids):
     }
     """
 
-    request = await client.post(
-        NABAT_URL,
-        json={
-            "operationName": "allProjects",
-            "query": query,
-            "variables": {"projectIds": project_ids},
-        },
-        headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
-    )
-    request.raise_for_status()
-
-    json = request.json()
+    data = await client.query("allProjects", query, {"projectIds": project_ids})
 
     # 0=indicates sharing allowed, 1 = sharing not allowed, null = not set, assume allowed
-    share_coords = (
-        pd.DataFrame(json["data"]["allPublicDataReferences"]["nodes"]).set_index("projectId").share_coords != 1
-    )
+    share_coords = pd.DataFrame(data["allPublicDataReferences"]["nodes"]).set_index("projectId").share_coords != 1
 
     if (~share_coords).any():
         raise NotImplementedError("Handle projects that do not allow sharing of coordinates; need to fuzz them")
 
-    df = pd.DataFrame(json["data"]["allProjects"]["nodes"]).join(share_coords, on="id")
+    df = pd.DataFrame(data["allProjects"]["nodes"]).join(share_coords, on="id")
     df["id"] = df.id.astype("uint")
     df["name"] = df.name.fillna("").str.strip()
 
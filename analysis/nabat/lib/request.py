@@ -0,0 +1,208 @@
+import asyncio
+import time
+
+import httpx
+
+from analysis.constants import NABAT_URL
+from analysis.nabat.lib.user import AccessToken
+
+
+class Timer(object):
+    def __init__(self):
+        """Accumulate time spent within one or more `with` blocks, e.g., time
+        spent decoding a response while it is downloaded."""
+        self.elapsed = 0
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed += time.perf_counter() - self._start
+
+
+class RequestStats(object):
+    def __init__(self):
+        """Accumulate timing, size, and retries of requests to NABat by GraphQL
+        operation."""
+        self.operations = {}
+
+    def record(self, operation, latency, read_time=0, decode_time=0, bytes=0, retried=False, failed=False):
+        """Record a single HTTP request.
+
+        Parameters
+        ----------
+        operation : str
+            GraphQL operation name
+        latency : float
+            seconds until response headers were received
+        read_time : float, optional (default: 0)
+            seconds to download response body, excluding decode_time
+        decode_time : float, optional (default: 0)
+            seconds to decode response body
+        bytes : int, optional (default: 0)
+            number of bytes in response body
+        retried : bool, optional (default: False)
+            True if the request failed and was retried
+        failed : bool, optional (default: False)
+            True if the request failed and was not retried
+        """
+        if operation not in self.operations:
+            self.operations[operation] = {
+                "requests": 0,
+                "retries": 0,
+                "failures": 0,
+                "bytes": 0,
+                "latency": 0,
+                "max_latency": 0,
+                "read_time": 0,
+                "max_read_time": 0,
+                "decode_time": 0,
+                "max_decode_time": 0,
+            }
+
+        stats = self.operations[operation]
+        stats["requests"] += 1
+        stats["retries"] += int(retried)
+        stats["failures"] += int(failed)
+        stats["bytes"] += bytes
+        stats["latency"] += latency
+        stats["max_latency"] = max(stats["max_latency"], latency)
+        stats["read_time"] += read_time
+        stats["max_read_time"] = max(stats["max_read_time"], read_time)
+        stats["decode_time"] += decode_time
+        stats["max_decode_time"] = max(stats["max_decode_time"], decode_time)
+
+    def summary(self):
+        """Summarize requests by operation
+
+        Returns
+        -------
+        dict
+            {<operation>: {"requests": <count>, "retries": <count>, ...}, ...};
+            latency, read, and decode times are in seconds
+        """
+        out = {}
+        for operation, stats in self.operations.items():
+            count = stats["requests"]
+            out[operation] = {
+                "requests": count,
+                "retries": stats["retries"],
+                "failures": stats["failures"],
+                "bytes": stats["bytes"],
+                "total_latency": round(stats["latency"], 3),
+                "mean_latency": round(stats["latency"] / count, 3),
+                "max_latency": round(stats["max_latency"], 3),
+                "total_read_time": round(stats["read_time"], 3),
+                "mean_read_time": round(stats["read_time"] / count, 3),
+                "max_read_time": round(stats["max_read_time"], 3),
+                "total_decode_time": round(stats["decode_time"], 3),
+                "mean_decode_time": round(stats["decode_time"] / count, 3),
+                "max_decode_time": round(stats["max_decode_time"], 3),
+            }
+
+        return out
+
+
+async def post_query(client, token, operation, query, variables=None, retries=4, backoff=2, read=None, stats=None):
+    """POST GraphQL query to NABat, retrying with exponential backoff on server
+    errors and timeouts.
+
+    Parameters
+    ----------
+    client : httpx.AsyncClient
+    token : str, AccessToken, or None
+        NABat access token; if an AccessToken, it is refreshed before it expires
+        and whenever NABat rejects it. If None, the request is not
+        authenticated.
+    operation : str
+        GraphQL operation name
+    query : str
+        GraphQL query
+    variables : dict, optional (default: None)
+        GraphQL query variables
+    retries : int, optional (default: 4)
+        maximum number of times to retry the request
+    backoff : int, optional (default: 2)
+        number of seconds to wait before first retry; this is doubled for each
+        subsequent retry
+    read : async function, optional (default: None)
+        if provided, called with the streaming response and a Timer to read its
+        body instead of parsing the entire response as JSON; the time spent
+        decoding the body must be measured within `with timer:` blocks so
+        that it is recorded separately from downloading the body. A failure
+        while reading the body is retried the same as any other transport error.
+    stats : RequestStats, optional (default: None)
+        if provided, timing, size, and retries of each request are recorded here
+
+    Returns
+    -------
+    dict
+        data returned by query, or result of read if provided
+    """
+    if stats is None:
+        stats = RequestStats()
+
+    json = {"operationName": operation, "query": query}
+    if variables is not None:
+        json["variables"] = variables
+
+    for attempt in range(retries + 1):
+        headers = {"Accept": "application/json"}
+        if token is not None:
+            access_token = await token.get() if isinstance(token, AccessToken) else token
+            headers["Authorization"] = f"Bearer {access_token}"
+
+        start = time.perf_counter()
+        latency = None
+
+        try:
+            async with client.stream("POST", NABAT_URL, json=json, headers=headers) as response:
+                latency = time.perf_counter() - start
+
+                if response.status_code == 401 and isinstance(token, AccessToken) and attempt < retries:
+                    stats.record(operation, latency, retried=True)
+                    token.invalidate()
+                    continue
+
+                if response.status_code < 500 or attempt == retries:
+                    if response.is_error:
+                        stats.record(operation, latency, failed=True)
+                        response.raise_for_status()
+
+                    read_start = time.perf_counter()
+                    decode = Timer()
+                    if read is not None:
+                        data = await read(response, decode)
+                    else:
+                        await response.aread()
+                        with decode:
+                            data = response.json()["data"]
+
+                    stats.record(
+                        operation,
+                        latency,
+                        read_time=time.perf_counter() - read_start - decode.elapsed,
+                        decode_time=decode.elapsed,
+                        bytes=response.num_bytes_downloaded,
+                    )
+                    return data
+
+                reason = f"status {response.status_code}"
+
+        except httpx.TransportError as ex:
+            if latency is None:
+                latency = time.perf_counter() - start
+
+            if attempt == retries:
+                stats.record(operation, latency, failed=True)
+                raise
+
+            reason = ex.__class__.__name__
+
+        stats.record(operation, latency, retried=True)
+
+        delay = backoff * 2**attempt
+        print(f"Retrying {operation} in {delay}s ({reason})")
+        await asyncio.sleep(delay)
@@ -1,18 +1,12 @@
 import pandas as pd
 
 
-from analysis.constants import NABAT_URL
-
-
-async def get_all_species(client, token):
+async def get_all_species(client):
     """Download lookup table of species IDs to species common & scientific names
 
     Parameters
     ----------
-    client : httpx.AsyncClient
-        _description_
-    token : str
-        NABat access token
+    client : NABatClient
 
     Returns
     -------
@@ -30,14 +24,6 @@ async def get_all_species(client, token):
     }
     """
 
-    request = await client.post(
-        NABAT_URL,
-        json={
-            "operationName": "allSpecies",
-            "query": query,
-        },
-        headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
-    )
-    request.raise_for_status()
+    data = await client.query("allSpecies", query)
 
-    return pd.DataFrame(request.json()["data"]["allSpecies"]["nodes"])
+    return pd.DataFrame(data["allSpecies"]["nodes"])
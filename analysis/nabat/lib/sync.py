@@ -0,0 +1,251 @@
+import asyncio
+from datetime import datetime, timezone
+import hashlib
+import json
+import time
+
+import httpx
+import pandas as pd
+
+from analysis.nabat.lib.bulk import fetch_project, merge_project_counts
+
+
+def get_fingerprint(row):
+    """Get fingerprint of project based on its counts of surveys and survey events
+
+    Parameters
+    ----------
+    row : namedtuple
+        project record with num_surveys and num_survey_events
+
+    Returns
+    -------
+    list
+    """
+    return [int(row.num_surveys), int(row.num_survey_events)]
+
+
+def hash_counts(df):
+    """Calculate a hash of the contents of a project's nightly counts
+
+    Parameters
+    ----------
+    df : DataFrame
+
+    Returns
+    -------
+    str
+    """
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+
+async def sync_stationary_acoustic_counts(client, project_df, out_dir, full=False, max_concurrency=4):
+    """Download nightly counts for projects that have changed since the last sync.
+
+    Counts are stored in one Feather file per project in out_dir/projects, and
+    a manifest of the fingerprint (count of surveys and survey events) and hash
+    of the counts for each project is stored in out_dir/manifest.json.
+
+    Only projects that are new or whose fingerprint changed since the last sync
+    are downloaded. NOTE: changes to counts of existing survey events in NABat
+    are not detected by the fingerprint; use full=True to re-download all
+    projects.
+
+    The counts of each project are written as soon as that project is
+    downloaded, and the manifest is saved even if the sync is interrupted, so
+    that projects already downloaded are not downloaded again by the next sync.
+    Projects that could not be downloaded after retrying requests are reported
+    and left as they were in the manifest, so that they are downloaded again by
+    the next sync.
+
+    Parameters
+    ----------
+    client : NABatClient
+    project_df : DataFrame
+        project info as returned by get_project_info
+    out_dir : Path
+        output directory
+    full : bool, optional (default: False)
+        if True, re-download all projects regardless of their fingerprints
+    max_concurrency : int, optional (default: 4)
+        maximum number of projects to download at the same time
+
+    Returns
+    -------
+    bool
+        True if the counts of any project were added, changed, or removed
+    """
+    shard_dir = out_dir / "projects"
+    shard_dir.mkdir(exist_ok=True, parents=True)
+    manifest_filename = out_dir / "manifest.json"
+
+    manifest = {}
+    if manifest_filename.exists():
+        manifest = json.loads(manifest_filename.read_text())
+
+    fingerprints = {str(row.id): get_fingerprint(row) for row in project_df.itertuples()}
+
+    project_ids = [
+        id
+        for id, fingerprint in fingerprints.items()
+        if full
+        or id not in manifest
+        or manifest[id]["fingerprint"] != fingerprint
+        or (manifest[id]["records"] > 0 and not (shard_dir / f"{id}.feather").exists())
+    ]
+    print(f"Found {len(project_ids):,} new or changed projects (out of {len(fingerprints):,})")
+
+    changed = False
+
+    # remove projects that are no longer available
+    for id in set(manifest.keys()).difference(fingerprints.keys()):
+        changed = True
+        (shard_dir / f"{id}.feather").unlink(missing_ok=True)
+        del manifest[id]
+
+    num_completed = 0
+    failed = {}
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch(id):
+        async with semaphore:
+            start = time.time()
+            try:
+                return id, await fetch_project(client, int(id)), time.time() - start
+            except (httpx.HTTPError, RuntimeError) as ex:
+                # NOTE: other errors are raised after the manifest is saved below
+                failed[id] = ex
+                print(f"Could not fetch project {id} from NABat: {ex}")
+                return id, None, None
+
+    tasks = [asyncio.ensure_future(fetch(id)) for id in project_ids]
+    try:
+        for task in asyncio.as_completed(tasks):
+            id, df, elapsed = await task
+            if df is None:
+                continue
+
+            num_completed += 1
+            print(
+                f"Fetched project {id} from NABat ({len(df):,} records) in {elapsed:.2f}s [{num_completed}/{len(project_ids)}]"
+            )
+
+            content_hash = hash_counts(df)
+            if manifest.get(id, {}).get("hash") != content_hash:
+                changed = True
+                filename = shard_dir / f"{id}.feather"
+                if len(df) > 0:
+                    df.reset_index(drop=True).to_feather(filename)
+                else:
+                    filename.unlink(missing_ok=True)
+
+            manifest[id] = {
+                "fingerprint": fingerprints[id],
+                "hash": content_hash,
+                "records": len(df),
+                "updated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+
+    finally:
+        for task in tasks:
+            task.cancel()
+
+        manifest_filename.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+
+    if failed:
+        print(
+            f"WARNING: could not fetch {len(failed):,} projects from NABat; these will be fetched again by the next sync: {', '.join(sorted(failed, key=int))}"
+        )
+
+    return changed
+
+
+def get_manifest_hash(manifest):
+    """Calculate a hash of the contents of all projects listed in a manifest
+
+    Parameters
+    ----------
+    manifest : dict
+        manifest created by sync_stationary_acoustic_counts
+
+    Returns
+    -------
+    str
+    """
+    entries = sorted(((id, entry["hash"]) for id, entry in manifest.items()), key=lambda x: int(x[0]))
+    return hashlib.sha256("\n".join(f"{id}:{hash}" for id, hash in entries).encode("utf8")).hexdigest()
+
+
+def is_combined_up_to_date(out_dir, filename):
+    """Check if combined counts written by write_combined_counts were combined
+    from the projects currently listed in the manifest.
+
+    Counts must be combined again if the combined file or the hash of the
+    manifest it was combined from is missing, if that hash differs from the
+    current manifest (e.g., projects were synced by a run that was interrupted
+    before combining them), or if the manifest or any project is newer than the
+    combined file.
+
+    Parameters
+    ----------
+    out_dir : Path
+        output directory used for sync_stationary_acoustic_counts
+    filename : Path
+        combined counts
+
+    Returns
+    -------
+    bool
+    """
+    manifest_filename = out_dir / "manifest.json"
+    info_filename = filename.with_suffix(".json")
+    if not (filename.exists() and info_filename.exists() and manifest_filename.exists()):
+        return False
+
+    manifest = json.loads(manifest_filename.read_text())
+    if json.loads(info_filename.read_text()).get("manifest_hash") != get_manifest_hash(manifest):
+        return False
+
+    modified = filename.stat().st_mtime
+    return all(f.stat().st_mtime <= modified for f in [manifest_filename, *(out_dir / "projects").glob("*.feather")])
+
+
+def write_combined_counts(df, out_dir, filename):
+    """Write combined counts and the hash of the manifest they were combined
+    from (to filename with a .json suffix), so that is_combined_up_to_date can
+    detect when they need to be combined again.
+
+    Parameters
+    ----------
+    df : DataFrame
+        combined counts from combine_stationary_acoustic_counts
+    out_dir : Path
+        output directory used for sync_stationary_acoustic_counts
+    filename : Path
+        combined counts
+    """
+    manifest = json.loads((out_dir / "manifest.json").read_text())
+
+    df.to_feather(filename)
+    filename.with_suffix(".json").write_text(
+        json.dumps({"manifest_hash": get_manifest_hash(manifest), "records": len(df)}, indent=2)
+    )
+
+
+def combine_stationary_acoustic_counts(out_dir):
+    """Combine per-project nightly counts created by sync_stationary_acoustic_counts
+    into a single table.
+
+    Parameters
+    ----------
+    out_dir : Path
+        output directory used for sync_stationary_acoustic_counts
+
+    Returns
+    -------
+    GeoDataFrame
+    """
+    manifest = json.loads((out_dir / "manifest.json").read_text())
+
+    ids = sorted((id for id, entry in manifest.items() if entry["records"] > 0), key=int)
+    return merge_project_counts([pd.read_feather(out_dir / "projects" / f"{id}.feather") for id in ids])
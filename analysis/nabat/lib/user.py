@@ -1,6 +1,6 @@
+import asyncio
 import re
-
-from analysis.constants import NABAT_URL
+import time
 
 
 def parse_R_token_cmd(cmd):
@@ -26,7 +26,7 @@ async def refresh_auth_token(client, refresh_token):
 
     Parameters
     ----------
-    client : https.AsyncClient
+    client : NABatClient
     refresh_token : str
         NABat refresh token
 
@@ -44,29 +44,70 @@ async def refresh_auth_token(client, refresh_token):
     }
     """
 
-    request = await client.post(
-        NABAT_URL,
-        json={
-            "operationName": "authTokenRefresh",
-            "query": query,
-            "variables": {"refreshTokenInput": {"refreshToken": refresh_token}},
-        },
+    data = await client.query(
+        "authTokenRefresh",
+        query,
+        {"refreshTokenInput": {"refreshToken": refresh_token}},
+        authenticate=False,
     )
-    request.raise_for_status()
 
-    info = request.json()["data"]["authTokenRefresh"]
+    info = data["authTokenRefresh"]
     info["access_token"] = info["access_token"].replace("Bearer ", "")
     return info
 
 
-async def get_user_id(client, token, email):
+class AccessToken(object):
+    def __init__(self, client, refresh_token, expiration_margin=60):
+        """Short-lived NABat access token that is automatically refreshed using
+        the NABat refresh token before it expires.
+
+        Parameters
+        ----------
+        client : NABatClient
+            client used to refresh the access token
+        refresh_token : str
+            NABat refresh token
+        expiration_margin : int, optional (default: 60)
+            number of seconds before expiration to refresh access token
+        """
+        self.client = client
+        self.refresh_token = refresh_token
+        self.expiration_margin = expiration_margin
+        self.user_id = None
+        self._token = None
+        self._expires = 0
+        self._lock = asyncio.Lock()
+
+    async def get(self):
+        """Get current access token, refreshing it first if it has not yet been
+        obtained or is close to expiring.
+
+        Returns
+        -------
+        str
+            NABat access token
+        """
+        # NOTE: lock prevents concurrent requests from each refreshing the token
+        async with self._lock:
+            if self._token is None or time.monotonic() >= self._expires - self.expiration_margin:
+                info = await refresh_auth_token(self.client, self.refresh_token)
+                self._token = info["access_token"]
+                self._expires = time.monotonic() + info["expires_in"]
+                self.user_id = info["user_id"]
+
+            return self._token
+
+    def invalidate(self):
+        """Force access token to be refreshed on next use (e.g., when rejected by NABat)"""
+        self._token = None
+
+
+async def get_user_id(client, email):
     """Use NABat user email address to fetch associated NABat user_id
 
     Parameters
     ----------
-    client : httpx.AsyncClient
-    token : str
-        NABat access token
+    client : NABatClient
     email : str
         email address for NABat account
 
@@ -83,15 +124,6 @@ async def get_user_id(client, token, email):
     }
     """
 
-    request = await client.post(
-        NABAT_URL,
-        json={
-            "operationName": "userByEmail",
-            "query": query,
-            "variables": {"email": email},
-        },
-        headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
-    )
-    request.raise_for_status()
+    data = await client.query("userByEmail", query, {"email": email})
 
-    return request.json()["data"]["userByEmail"]["id"]
+    return data["userByEmail"]["id"]
@@ -0,0 +1,68 @@
+import numpy as np
+import shapely
+
+from analysis.lib.spatial import SpatialIndex
+
+
+def get_large_polygon(num_vertices=200_000):
+    """Create a star-shaped polygon with many vertices, similar to a detailed
+    state boundary"""
+    angles = np.linspace(0, 2 * np.pi, num_vertices, endpoint=False)
+    radius = 1 + 0.1 * np.sin(angles * 500)
+    return shapely.Polygon(np.stack([radius * np.cos(angles), radius * np.sin(angles)], axis=1))
+
+
+def get_points(num_points=100_000, seed=0):
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform(-1.2, 1.2, size=(num_points // 2, 2))
+    # include repeated coordinates, as for records at the same site
+    coords = np.concatenate([coords, coords[rng.integers(0, len(coords), num_points - len(coords))]])
+    return shapely.points(coords)
+
+
+def query_by_tree_over_points(points, geometries, predicate="intersects", distance=None):
+    """Find pairs of points and geometries by building a tree over all points
+    and querying it with each geometry; this is how lookups were done before
+    SpatialIndex was added"""
+    geom_ix, point_ix = shapely.STRtree(points).query(geometries, predicate=predicate, distance=distance)
+    sort_ix = np.lexsort([geom_ix, point_ix])
+    return point_ix.take(sort_ix), geom_ix.take(sort_ix)
+
+
+def test_query_points_large_polygon():
+    polygon = get_large_polygon()
+    points = get_points()
+
+    expected = query_by_tree_over_points(points, [polygon])
+    actual = SpatialIndex([polygon]).query_points(points)
+
+    assert len(expected[0]) > 0
+    np.testing.assert_array_equal(actual[0], expected[0])
+    np.testing.assert_array_equal(actual[1], expected[1])
+
+
+def test_query_points_multiple_geometries():
+    geometries = shapely.buffer(shapely.points([[0, 0], [0.5, 0], [5, 5]]), 0.4)
+    points = get_points(num_points=10_000)
+
+    actual = SpatialIndex(geometries).query_points(points)
+    expected = query_by_tree_over_points(points, geometries)
+    np.testing.assert_array_equal(actual[0], expected[0])
+    np.testing.assert_array_equal(actual[1], expected[1])
+
+
+def test_query_points_dwithin():
+    centers = shapely.points([[0, 0], [0.5, 0.5]])
+    points = get_points(num_points=10_000)
+
+    actual = SpatialIndex(centers).query_points(points, predicate="dwithin", distance=0.1)
+    expected = query_by_tree_over_points(points, centers, predicate="dwithin", distance=0.1)
+    np.testing.assert_array_equal(actual[0], expected[0])
+    np.testing.assert_array_equal(actual[1], expected[1])
+
+
+def test_intersects_points():
+    polygon = shapely.box(0, 0, 1, 1)
+    points = shapely.points([[0.5, 0.5], [2, 2], [0.5, 0.5], [1, 1]])
+
+    np.testing.assert_array_equal(SpatialIndex([polygon]).intersects_points(points), [True, False, True, True])
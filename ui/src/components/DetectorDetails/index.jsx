@@ -3,7 +3,7 @@ import PropTypes from 'prop-types'
 import { escape, op } from 'arquero'
 import { Flex } from 'theme-ui'
 
-import { useCrossfilter } from 'components/Crossfilter'
+import { useCrossfilter, filterTable } from 'components/Crossfilter'
 import Detector from './Detector'
 import Iterator from './Iterator'
 
@@ -18,20 +18,24 @@ const DetectorDetails = ({
   onClose,
 }) => {
   const {
-    state: { filteredTable },
+    state: { filteredTable, dimensions, filters },
   } = useCrossfilter()
 
   const [index, setIndex] = useState(0)
 
   // filter detectors based on current state of filters
-  const detectorIds = useMemo(
-    () =>
-      filteredTable
-        .filter(escape((d) => d.siteId === siteId))
-        .rollup({ detId: op.array_agg_distinct('detId') })
-        .array('detId')[0],
-    [filteredTable, siteId]
-  )
+  const detectorIds = useMemo(() => {
+    // the occurrence map filters data aggregated across detectors at each
+    // site; apply the same filters to the detector-level table instead
+    const detectorTable = filteredTable.columnNames().includes('detId')
+      ? filteredTable
+      : filterTable({ table, dimensions, filters })
+
+    return detectorTable
+      .filter(escape((d) => d.siteId === siteId))
+      .rollup({ detId: op.array_agg_distinct('detId') })
+      .array('detId')[0]
+  }, [filteredTable, table, dimensions, filters, siteId])
 
   return (
     <Flex sx={{ flexDirection: 'column', height: '100%' }}>
@@ -12,12 +12,51 @@ const fetchFeather = async (url) => {
   return fromArrow(bytes)
 }
 
+const fetchJSON = async (url) => {
+  const response = await fetch(url)
+  if (response.status !== 200) {
+    throw new Error(`Failed request to ${url}: ${response.statusText}`)
+  }
+
+  return response.json()
+}
+
+// create lookup of name by ID
+const toLookup = (table, getName = ({ name }) => name) =>
+  Object.fromEntries(table.objects().map((d) => [d.id, getName(d)]))
+
 const loadData = async () => {
-  const [detectorsTable, rawSpeciesTable] = await Promise.all([
+  const [
+    rawDetectorsTable,
+    rawSpeciesTable,
+    datasetsTable,
+    organizationsTable,
+    contributorsTable,
+  ] = await Promise.all([
     fetchFeather('/data/detectors.feather'),
     fetchFeather('/data/spp_detections.feather'),
+    fetchFeather('/data/datasets.feather'),
+    fetchFeather('/data/organizations.feather'),
+    fetchFeather('/data/contributors.feather'),
   ])
 
+  // detectors are linked to datasets, organizations, and contributors by
+  // arrays of IDs; resolve these to comma-delimited names
+  const datasets = toLookup(
+    datasetsTable,
+    ({ name, datasetId }) => `${name}|${datasetId}`
+  )
+  const organizations = toLookup(organizationsTable)
+  const contributors = toLookup(contributorsTable)
+  const joinNames = (ids, lookup) =>
+    Array.from(ids, (id) => lookup[id]).join(',')
+
+  const detectorsTable = rawDetectorsTable.derive({
+    dataset: escape((d) => joinNames(d.dataset, datasets)),
+    organization: escape((d) => joinNames(d.organization, organizations)),
+    contributors: escape((d) => joinNames(d.contributors, contributors)),
+  })
+
   return {
     detectorsTable,
     // join in species codes and detector info
@@ -41,23 +80,21 @@ const loadData = async () => {
   }
 }
 
+// load occurrence cube and filter values created by merge.py; these are
+// pre-joined to detector attributes and aggregated across detectors at each
+// site, so only the cube needs to be loaded before the map can be shown
 export const loadOccurrenceData = async () => {
-  const { detectorsTable, allSpeciesTable } = await loadData()
+  const [rawOccurrenceTable, occurrenceFilters] = await Promise.all([
+    fetchFeather('/data/occurrence.feather'),
+    fetchJSON('/data/occurrence_filters.json'),
+  ])
 
-  const {
-    admin1Name: admin1Names,
-    species,
-    years,
-  } = allSpeciesTable
-    .rollup({
-      admin1Name: op.array_agg_distinct('admin1Name'),
-      species: op.array_agg_distinct('species'),
-      years: op.array_agg_distinct('year'),
-    })
-    .objects()[0]
+  const occurrenceTable = rawOccurrenceTable.derive({
+    species: escape((d) => SPECIES_ID[d.species]),
+  })
 
-  admin1Names.sort()
-  years.sort()
+  const { admin1Name: admin1Names, years } = occurrenceFilters
+  const species = occurrenceFilters.species.map((id) => SPECIES_ID[id])
 
   // sort species by commonName
   const sortedSpecies = species
@@ -117,12 +154,15 @@ export const loadOccurrenceData = async () => {
   ]
 
   return {
-    detectorsTable,
-    allSpeciesTable,
+    occurrenceTable,
     filters,
   }
 }
 
+// load detector-level data used to show details of a selected detector or
+// hexagon on the occurrence map
+export const loadOccurrenceDetails = loadData
+
 export const loadSingleSpeciesData = async (speciesID) => {
   const { detectorsTable: rawDetectorsTable, allSpeciesTable } =
     await loadData()
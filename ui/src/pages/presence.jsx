@@ -9,7 +9,7 @@ import { Provider as CrossfilterProvider } from 'components/Crossfilter'
 import Sidebar from 'components/Sidebar'
 import DetectorDetails from 'components/DetectorDetails'
 import HexDetails from 'components/HexDetails'
-import { loadOccurrenceData } from 'data/api'
+import { loadOccurrenceData, loadOccurrenceDetails } from 'data/api'
 import { Map, PresenceFilters } from 'components/SpeciesPresence'
 
 const PresencePage = () => {
@@ -18,7 +18,7 @@ const PresencePage = () => {
   const {
     isLoading,
     error,
-    data: { detectorsTable, allSpeciesTable, filters } = {},
+    data: { occurrenceTable, filters } = {},
   } = useQuery({
     queryKey: ['occurrence'],
     queryFn: loadOccurrenceData,
@@ -36,6 +36,22 @@ const PresencePage = () => {
     selectedType: null,
   })
 
+  // detector-level data are only needed to show details of a selected
+  // detector or hex, so they are not loaded until a feature is first selected
+  const {
+    isPending: isDetailsPending,
+    error: detailsError,
+    data: { detectorsTable, allSpeciesTable } = {},
+  } = useQuery({
+    queryKey: ['occurrenceDetails'],
+    queryFn: loadOccurrenceDetails,
+    enabled: selectedFeature !== null,
+
+    retry: true,
+    refetchOnWindowFocus: false,
+    refetchOnMount: false,
+  })
+
   const handleSelectFeature = (feature) => {
     if (feature === null) {
       setState(() => ({
@@ -90,8 +106,8 @@ const PresencePage = () => {
     )
   }
 
-  if (error) {
-    console.error(error)
+  if (error || detailsError) {
+    console.error(error || detailsError)
 
     return (
       <Layout>
@@ -104,7 +120,7 @@ const PresencePage = () => {
     <Layout>
       <Flex sx={{ height: '100%', width: '100%' }}>
         <CrossfilterProvider
-          table={allSpeciesTable}
+          table={occurrenceTable}
           filters={filters}
           valueField="speciesDetected"
           aggFuncs={{ speciesDetected: op.distinct('species') }}
@@ -117,7 +133,23 @@ const PresencePage = () => {
               <PresenceFilters filters={filters} />
             ) : null}
 
-            {selectedFeature !== null && selectedType === 'detector' ? (
+            {selectedFeature !== null && isDetailsPending ? (
+              <Flex
+                sx={{
+                  height: '100%',
+                  alignItems: 'center',
+                  justifyContent: 'center',
+                  gap: '1rem',
+                }}
+              >
+                <Spinner size="2rem" />
+                <Text>Loading...</Text>
+              </Flex>
+            ) : null}
+
+            {selectedFeature !== null &&
+            !isDetailsPending &&
+            selectedType === 'detector' ? (
               <DetectorDetails
                 key={selectedFeature.id}
                 siteId={selectedFeature.id}
@@ -128,7 +160,9 @@ const PresencePage = () => {
               />
             ) : null}
 
-            {selectedFeature !== null && selectedType === 'hex' ? (
+            {selectedFeature !== null &&
+            !isDetailsPending &&
+            selectedType === 'hex' ? (
               <HexDetails
                 id={selectedFeature.id}
                 level={selectedFeature.sourceLayer}